@@ -47,6 +47,15 @@ const notificationSchema = new mongoose.Schema({
   },
   metadata: {
     type: mongoose.Schema.Types.Mixed
+  },
+  // Bot worker that claimed the notification for sending, until expiresAt
+  lease: {
+    owner: String,
+    token: {
+      type: String,
+      index: true
+    },
+    expiresAt: Date
   }
 }, {
   timestamps: true
@@ -56,5 +65,6 @@ const notificationSchema = new mongoose.Schema({
 notificationSchema.index({ type: 1, status: 1, createdAt: -1 });
 notificationSchema.index({ session: 1, createdAt: -1 });
 notificationSchema.index({ 'recipients.users': 1 });
+notificationSchema.index({ channel: 1, status: 1, 'lease.expiresAt': 1, createdAt: 1 });
 
 module.exports = mongoose.model('Notification', notificationSchema);
@@ -1,10 +1,37 @@
 const express = require('express');
+const mongoose = require('mongoose');
 const router = express.Router();
 const Notification = require('../models/Notification');
 const User = require('../models/User');
 const { webhookAuth } = require('../middleware/auth');
 const { validateWebhookAlert } = require('../middleware/validateRequest');
 const { webhookLimiter } = require('../middleware/rateLimiter');
+const { groupNotifications } = require('../utils/notificationGroups');
+const { claimableFilter, claimNotifications } = require('../utils/notificationLeases');
+
+const NOTIFICATION_STATUSES = ['pending', 'sent', 'failed', 'delivered'];
+const MAX_BULK_STATUS_UPDATES = 500;
+
+// Build notification update document for a delivery status
+const buildStatusUpdate = (status, error) => {
+  const updateData = { status };
+
+  if (status === 'sent' || status === 'delivered') {
+    updateData.sentAt = new Date();
+  }
+  if (status === 'delivered') {
+    updateData.deliveredAt = new Date();
+  }
+  if (status === 'pending') {
+    // Handed back by the worker holding it: claimable again right away
+    updateData.lease = null;
+  }
+  if (error) {
+    updateData.error = error;
+  }
+
+  return updateData;
+};
 
 // @route   POST /api/webhooks/telegram/notification-status
 // @desc    Webhook endpoint for Telegram bot to update notification delivery status
@@ -17,21 +44,63 @@ router.post('/telegram/notification-status', webhookLimiter, webhookAuth, async
       return res.status(400).json({ message: 'notificationId and status are required' });
     }
 
-    const updateData = {
-      status,
-      sentAt: status === 'sent' || status === 'delivered' ? new Date() : undefined,
-      deliveredAt: status === 'delivered' ? new Date() : undefined
-    };
+    await Notification.findByIdAndUpdate(notificationId, buildStatusUpdate(status, error));
+
+    res.json({ 
+      success: true,
+      message: 'Notification status updated'
+    });
+  } catch (error) {
+    console.error('Webhook error:', error);
+    res.status(500).json({ message: 'Server error', error: error.message });
+  }
+});
+
+// @route   POST /api/webhooks/telegram/notification-status/bulk
+// @desc    Update delivery status of many notifications in one request
+// @access  Protected (requires API key)
+router.post('/telegram/notification-status/bulk', webhookLimiter, webhookAuth, async (req, res) => {
+  try {
+    const { updates } = req.body;
+
+    if (!Array.isArray(updates) || updates.length === 0) {
+      return res.status(400).json({ message: 'updates must be a non-empty array' });
+    }
 
-    if (error) {
-      updateData.error = error;
+    if (updates.length > MAX_BULK_STATUS_UPDATES) {
+      return res.status(400).json({ message: `No more than ${MAX_BULK_STATUS_UPDATES} updates per request` });
     }
 
-    await Notification.findByIdAndUpdate(notificationId, updateData);
+    const operations = [];
+    const rejected = [];
 
-    res.json({ 
+    updates.forEach((update) => {
+      const { notificationId, status, error } = update || {};
+
+      if (!mongoose.isValidObjectId(notificationId) || !NOTIFICATION_STATUSES.includes(status)) {
+        rejected.push(notificationId || null);
+        return;
+      }
+
+      operations.push({
+        updateOne: {
+          filter: { _id: notificationId },
+          update: buildStatusUpdate(status, error)
+        }
+      });
+    });
+
+    let modified = 0;
+    if (operations.length > 0) {
+      const result = await Notification.bulkWrite(operations, { ordered: false });
+      modified = result.modifiedCount;
+    }
+
+    res.json({
       success: true,
-      message: 'Notification status updated'
+      message: 'Notification statuses updated',
+      updated: modified,
+      rejected
     });
   } catch (error) {
     console.error('Webhook error:', error);
@@ -45,19 +114,58 @@ router.post('/telegram/notification-status', webhookLimiter, webhookAuth, async
 router.get('/telegram/pending-notifications', webhookLimiter, webhookAuth, async (req, res) => {
   try {
     const limit = parseInt(req.query.limit) || 50;
-    
-    const notifications = await Notification.find({
+    let filter = {
       channel: 'telegram',
       status: 'pending'
-    })
-    .limit(limit)
-    .sort({ createdAt: 1 })
-    .populate('recipients.users', 'telegramChatId telegramId name')
-    .populate('session');
+    };
+    let pendingFilter = filter;
+    let lease;
+
+    // With a workerId the batch is claimed: other workers don't get it until the lease expires
+    if (req.query.workerId) {
+      const claim = await claimNotifications({ channel: 'telegram' }, {
+        workerId: String(req.query.workerId),
+        limit,
+        leaseSeconds: req.query.leaseSeconds
+      });
+      filter = claim.token ? { ...filter, 'lease.token': claim.token } : { _id: { $in: [] } };
+      pendingFilter = claimableFilter({ channel: 'telegram' });
+      lease = { owner: String(req.query.workerId), expiresAt: claim.expiresAt };
+    }
+
+    if (req.query.grouped === 'true') {
+      const [notifications, pending] = await Promise.all([
+        Notification.find(filter)
+          .limit(limit)
+          .sort({ createdAt: 1 })
+          .populate('session', 'teacher groups subgroup startAt endAt')
+          .lean(),
+        Notification.countDocuments(pendingFilter)
+      ]);
+
+      return res.json({
+        success: true,
+        count: notifications.length,
+        pending,
+        lease,
+        broadcasts: groupNotifications(notifications)
+      });
+    }
+    
+    const [notifications, pending] = await Promise.all([
+      Notification.find(filter)
+        .limit(limit)
+        .sort({ createdAt: 1 })
+        .populate('recipients.users', 'telegramChatId telegramId name')
+        .populate('session'),
+      Notification.countDocuments(pendingFilter)
+    ]);
 
     res.json({ 
       success: true,
       count: notifications.length,
+      pending,
+      lease,
       notifications
     });
   } catch (error) {
@@ -1,5 +1,47 @@
+const axios = require('axios');
 const Notification = require('../models/Notification');
 const User = require('../models/User');
+const { groupNotifications } = require('../utils/notificationGroups');
+const { leaseNotifications, releaseNotifications } = require('../utils/notificationLeases');
+
+// Optional push endpoint of the Telegram bot (e.g. http://localhost:8081/notifications)
+const TELEGRAM_BOT_PUSH_URL = process.env.TELEGRAM_BOT_PUSH_URL;
+
+// Push freshly created notifications to the bot so they are sent without waiting for the next poll.
+// Failures are only logged: the bot still picks pending notifications up by polling.
+// Pushed notifications are leased so that polling workers don't send them a second time.
+// The session summary lets the bot update its local schedule snapshots in place
+const pushToBot = async (notifications, session = null) => {
+  if (!TELEGRAM_BOT_PUSH_URL || notifications.length === 0) {
+    return;
+  }
+
+  const sessionSummary = session ? {
+    _id: session._id,
+    teacher: session.teacher?._id || session.teacher,
+    groups: (session.groups || []).map(group => group?._id || group),
+    subgroup: session.subgroup,
+    type: session.type,
+    startAt: session.startAt,
+    endAt: session.endAt
+  } : null;
+
+  const ids = notifications.map(notification => notification._id);
+  try {
+    await leaseNotifications(ids, 'push');
+    await axios.post(TELEGRAM_BOT_PUSH_URL, {
+      broadcasts: groupNotifications(notifications, sessionSummary)
+    }, {
+      headers: { 'x-api-key': process.env.WEBHOOK_API_KEY },
+      timeout: 5000
+    });
+  } catch (error) {
+    console.error('Failed to push notifications to bot (will be picked up by polling):', error.message);
+    await releaseNotifications(ids, 'push').catch(releaseError => {
+      console.error('Failed to release pushed notifications:', releaseError.message);
+    });
+  }
+};
 
 // Format schedule change message
 const formatScheduleChangeMessage = (type, session, changes = {}) => {
@@ -196,7 +238,9 @@ const notifyScheduleChange = async (type, session, changes = {}) => {
             title: 'Изменение расписания',
             data: { 
               sessionId: session._id,
-              chatId: user.telegramChatId
+              chatId: user.telegramChatId,
+              // What the update changed, so the bot knows whether it can patch its snapshots in place
+              changes
             }
           }
         })
@@ -205,6 +249,8 @@ const notifyScheduleChange = async (type, session, changes = {}) => {
 
     console.log(`Created ${notifications.length} notification records for ${type}`);
     console.log('External Telegram bot will process these notifications');
+
+    pushToBot(notifications, session);
   } catch (error) {
     console.error('Error creating notifications for schedule change:', error);
     throw error;
@@ -229,6 +275,8 @@ const createNotification = async (chatId, message, telegramId = null) => {
     });
 
     console.log('Created notification record - external bot will process');
+
+    pushToBot([notification]);
     return { success: true, notificationId: notification._id };
   } catch (error) {
     console.error('Error creating notification:', error);
@@ -0,0 +1,29 @@
+/**
+ * Collapse notifications of one change into broadcasts: the message is sent once,
+ * followed by the list of chats it goes to
+ */
+const groupNotifications = (notifications, session = null) => {
+  const broadcasts = new Map();
+
+  for (const notification of notifications) {
+    const { chatId, ...data } = notification.payload?.data || {};
+    const notificationSession = session || notification.session;
+    const sessionId = notificationSession?._id || notificationSession;
+    const key = [notification.type, String(sessionId), notification.payload?.message].join('|');
+
+    if (!broadcasts.has(key)) {
+      broadcasts.set(key, {
+        type: notification.type,
+        session: notificationSession,
+        recipients: { groups: notification.recipients?.groups || [] },
+        payload: { ...notification.payload, data },
+        chats: []
+      });
+    }
+    broadcasts.get(key).chats.push({ _id: notification._id, chatId });
+  }
+
+  return [...broadcasts.values()];
+};
+
+module.exports = { groupNotifications };
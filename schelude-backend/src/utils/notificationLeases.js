@@ -0,0 +1,70 @@
+const crypto = require('crypto');
+const Notification = require('../models/Notification');
+
+const DEFAULT_LEASE_SECONDS = parseInt(process.env.NOTIFICATION_LEASE_SECONDS, 10) || 120;
+const MAX_LEASE_SECONDS = 600;
+
+const leaseDuration = (seconds) => {
+  const parsed = parseInt(seconds, 10) || DEFAULT_LEASE_SECONDS;
+  return Math.min(Math.max(parsed, 1), MAX_LEASE_SECONDS);
+};
+
+// Pending notifications that no worker holds a live lease on
+const claimableFilter = (filter, now = new Date()) => ({
+  ...filter,
+  status: 'pending',
+  $or: [{ 'lease.expiresAt': null }, { 'lease.expiresAt': { $lte: now } }]
+});
+
+/**
+ * Claim up to `limit` pending notifications for a worker until the lease expires.
+ * Candidates are taken with a conditional update, so concurrent workers never get the
+ * same notification; the returned token identifies exactly the documents this call won.
+ * Notifications that are not acknowledged before the lease expires become claimable again.
+ */
+const claimNotifications = async (filter, { workerId, limit, leaseSeconds }) => {
+  const now = new Date();
+  const expiresAt = new Date(now.getTime() + leaseDuration(leaseSeconds) * 1000);
+
+  const candidates = await Notification.find(claimableFilter(filter, now))
+    .sort({ createdAt: 1 })
+    .limit(limit)
+    .select('_id')
+    .lean();
+
+  if (candidates.length === 0) {
+    return { token: null, expiresAt };
+  }
+
+  const token = `${workerId}:${crypto.randomUUID()}`;
+  await Notification.updateMany(
+    { _id: { $in: candidates.map(candidate => candidate._id) }, ...claimableFilter(filter, now) },
+    { $set: { lease: { owner: workerId, token, expiresAt } } }
+  );
+
+  return { token, expiresAt };
+};
+
+// Lease specific notifications (e.g. the ones pushed to the bot) so pollers leave them alone
+const leaseNotifications = async (ids, owner, leaseSeconds) => {
+  const expiresAt = new Date(Date.now() + leaseDuration(leaseSeconds) * 1000);
+  await Notification.updateMany(
+    { _id: { $in: ids }, status: 'pending' },
+    { $set: { lease: { owner, token: `${owner}:${crypto.randomUUID()}`, expiresAt } } }
+  );
+};
+
+// Give leased notifications back to the queue right away
+const releaseNotifications = async (ids, owner) => {
+  await Notification.updateMany(
+    { _id: { $in: ids }, status: 'pending', 'lease.owner': owner },
+    { $unset: { lease: '' } }
+  );
+};
+
+module.exports = {
+  claimableFilter,
+  claimNotifications,
+  leaseNotifications,
+  releaseNotifications
+};
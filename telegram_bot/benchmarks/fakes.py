@@ -0,0 +1,300 @@
+"""
+Local stand-ins for the Telegram Bot API and the schedule backend used by the benchmarks
+"""
+
+import json
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+LOCAL_TZ = timezone(timedelta(hours=5))
+# Pair start times (local), as in the backend's pair schedule
+PAIR_TIMES = [(8, 30), (10, 15), (12, 0), (14, 15), (16, 0), (17, 45)]
+SESSION_TYPES = ['lecture', 'seminar', 'lab', 'practice']
+
+
+class FaultInjector:
+    """Configurable latency and error rate of a fake service"""
+    
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+    
+    async def delay(self) -> bool:
+        """Wait the configured latency; returns True if this request should fail"""
+        self.requests += 1
+        latency = self.latency + self._random.uniform(0, self.jitter)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+
+class FakeService:
+    """aiohttp server on a local port"""
+    
+    def __init__(self, faults: FaultInjector):
+        self.faults = faults
+        self.app = web.Application()
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+    
+    async def start(self, port: int = 0) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', port).start()
+        self.port = self._runner.addresses[0][1]
+    
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class FakeTelegramAPI(FakeService):
+    """Bot API methods the bot uses, answering with minimal valid objects"""
+    
+    def __init__(self, faults: FaultInjector):
+        super().__init__(faults)
+        self.app.router.add_post('/bot{token}/{method}', self._handle)
+        self._message_id = 0
+        self.calls: Dict[str, int] = {}
+        self.messages_sent = 0
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post()) if request.body_exists else {}
+        
+        if await self.faults.delay():
+            return web.json_response(
+                {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}, status=502
+            )
+        
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+            }})
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            self._message_id += 1
+            if method == 'sendMessage':
+                self.messages_sent += 1
+            return web.json_response({'ok': True, 'result': {
+                'message_id': int(params.get('message_id') or self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }})
+        return web.json_response({'ok': True, 'result': True})
+
+
+def make_session(session_id: str, start: datetime, group: str, teacher: Tuple[str, str], course: int) -> dict:
+    return {
+        '_id': session_id,
+        'course': {'_id': f"c{course}", 'name': f"Дисциплина {course}"},
+        'teacher': {'_id': teacher[0], 'name': teacher[1]},
+        'room': {'building': 'Главный корпус', 'number': str(100 + course % 300)},
+        'startAt': start.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'endAt': (start + timedelta(minutes=90)).astimezone(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'groups': [group],
+        'subgroup': 'all',
+        'type': SESSION_TYPES[course % len(SESSION_TYPES)],
+        'status': 'scheduled',
+        'pairNumber': PAIR_TIMES.index((start.hour, start.minute)) + 1,
+        'updatedAt': '2026-01-01T00:00:00Z',
+    }
+
+
+class FakeBackend(FakeService):
+    """Schedule backend with a generated timetable and a notification queue"""
+    
+    def __init__(self, faults: FaultInjector, groups: int, teachers: int, pairs_per_day: int = 4, seed: int = 1):
+        super().__init__(faults)
+        rng = random.Random(seed)
+        self.groups = [f"{(i // 40) + 1}{i % 40 + 1:02d}-{20 + i % 6}" for i in range(groups)]
+        self.teachers = [(f"t{i}", f"Преподаватель {i} {chr(0x410 + i % 32)}.") for i in range(teachers)]
+        self.sessions_by_group: Dict[str, List[dict]] = {}
+        self.sessions_by_teacher: Dict[str, List[dict]] = {}
+        
+        today = datetime.now(LOCAL_TZ).date()
+        week_start = today - timedelta(days=today.weekday())
+        for g, group in enumerate(self.groups):
+            sessions = []
+            for day in range(14):
+                day_date = week_start + timedelta(days=day)
+                if day_date.weekday() == 6:
+                    continue
+                for pair in range(pairs_per_day):
+                    hour, minute = PAIR_TIMES[pair]
+                    start = datetime(day_date.year, day_date.month, day_date.day, hour, minute, tzinfo=LOCAL_TZ)
+                    teacher = self.teachers[rng.randrange(len(self.teachers))]
+                    session = make_session(f"s{g}-{day}-{pair}", start, group, teacher, rng.randrange(1000))
+                    sessions.append(session)
+                    self.sessions_by_teacher.setdefault(teacher[0], []).append(session)
+            self.sessions_by_group[group] = sessions
+        
+        self._notifications: List[dict] = []
+        self.acknowledged = 0
+        self.failed = 0
+        self.registered = 0
+        self._groups_body = json.dumps({'success': True, 'groups': self.groups})
+        self._teachers_body = json.dumps({
+            'success': True, 'teachers': [{'_id': tid, 'name': name} for tid, name in self.teachers]
+        })
+        
+        routes = self.app.router
+        routes.add_get('/api/schedule/groups', self._groups)
+        routes.add_get('/api/schedule/teachers', self._teachers)
+        routes.add_get('/api/schedule/group/{group}/range', self._group_range)
+        routes.add_get('/api/schedule/group/{group}/{period}', self._group_period)
+        routes.add_get('/api/schedule/teacher/{teacher}/{period}', self._teacher_period)
+        routes.add_get('/api/webhooks/telegram/user/{telegram_id}', self._user)
+        routes.add_post('/api/webhooks/telegram/register', self._register)
+        routes.add_get('/api/webhooks/telegram/pending-notifications', self._pending)
+        routes.add_post('/api/webhooks/telegram/notification-status/bulk', self._status_bulk)
+        routes.add_post('/api/webhooks/telegram/notification-status', self._status)
+    
+    @property
+    def queued(self) -> int:
+        """Broadcasts not handed out yet"""
+        return len(self._notifications)
+    
+    def queue_broadcasts(self, recipients: Dict[str, List[int]], per_group: int = 1) -> int:
+        """Queue a schedule change notification for each group; returns the number of chats addressed"""
+        total = 0
+        for group, chat_ids in recipients.items():
+            for n in range(per_group):
+                session = self.sessions_by_group[group][n % len(self.sessions_by_group[group])]
+                self._notifications.append({
+                    'type': 'session_updated',
+                    'session': {'_id': session['_id'], 'subgroup': 'all', 'startAt': session['startAt']},
+                    'recipients': {'groups': [group]},
+                    'payload': {'message': f"⚠️ Изменение в расписании группы {group}: {session['course']['name']}",
+                                'data': {}},
+                    'chats': [{'_id': f"n{len(self._notifications)}-{chat_id}", 'chatId': str(chat_id)}
+                              for chat_id in chat_ids],
+                })
+                total += len(chat_ids)
+        return total
+    
+    async def _fail_or(self, build) -> web.Response:
+        if await self.faults.delay():
+            return web.json_response({'success': False, 'message': 'Injected failure'}, status=500)
+        return build()
+    
+    @staticmethod
+    def _window(request: web.Request, period: str) -> Tuple[datetime, datetime]:
+        today = datetime.now(LOCAL_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == 'range':
+            return (datetime.fromisoformat(request.query['startDate']),
+                    datetime.fromisoformat(request.query['endDate']))
+        if period == 'tomorrow':
+            return today + timedelta(days=1), today + timedelta(days=2)
+        if period == 'week':
+            start = today - timedelta(days=today.weekday())
+            return start, start + timedelta(days=7)
+        return today, today + timedelta(days=1)
+    
+    @staticmethod
+    def _select(sessions: List[dict], start: datetime, end: datetime) -> List[dict]:
+        start_z = start.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+        end_z = end.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+        return [session for session in sessions if start_z <= session['startAt'] < end_z]
+    
+    @staticmethod
+    def _period_body(period: str, sessions: List[dict], start: datetime) -> dict:
+        if period != 'week':
+            return {'success': True, 'sessions': sessions, 'date': start.date().isoformat()}
+        schedule: Dict[str, List[dict]] = {}
+        for session in sessions:
+            day = datetime.fromisoformat(session['startAt'].replace('Z', '+00:00')).astimezone(LOCAL_TZ)
+            schedule.setdefault(day.date().isoformat(), []).append(session)
+        return {'success': True, 'schedule': schedule}
+    
+    async def _groups(self, request: web.Request) -> web.Response:
+        return await self._fail_or(lambda: web.Response(text=self._groups_body, content_type='application/json'))
+    
+    async def _teachers(self, request: web.Request) -> web.Response:
+        return await self._fail_or(lambda: web.Response(text=self._teachers_body, content_type='application/json'))
+    
+    async def _group_range(self, request: web.Request) -> web.Response:
+        sessions = self.sessions_by_group.get(request.match_info['group'], [])
+        start, end = self._window(request, 'range')
+        return await self._fail_or(lambda: web.json_response(
+            {'success': True, 'sessions': self._select(sessions, start, end)}
+        ))
+    
+    async def _group_period(self, request: web.Request) -> web.Response:
+        period = request.match_info['period']
+        sessions = self.sessions_by_group.get(request.match_info['group'], [])
+        start, end = self._window(request, period)
+        return await self._fail_or(lambda: web.json_response(
+            self._period_body(period, self._select(sessions, start, end), start)
+        ))
+    
+    async def _teacher_period(self, request: web.Request) -> web.Response:
+        period = request.match_info['period']
+        sessions = self.sessions_by_teacher.get(request.match_info['teacher'], [])
+        start, end = self._window(request, period)
+        return await self._fail_or(lambda: web.json_response(
+            self._period_body(period, self._select(sessions, start, end), start)
+        ))
+    
+    async def _user(self, request: web.Request) -> web.Response:
+        return await self._fail_or(lambda: web.json_response({'success': False}, status=404))
+    
+    async def _register(self, request: web.Request) -> web.Response:
+        self.registered += 1
+        return await self._fail_or(lambda: web.json_response({'success': True}))
+    
+    async def _pending(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get('limit', 50))
+        
+        def build():
+            # Hand out whole broadcasts until the page is full
+            page, size = [], 0
+            while self._notifications and size < limit:
+                broadcast = self._notifications.pop(0)
+                page.append(broadcast)
+                size += len(broadcast['chats'])
+            pending = sum(len(broadcast['chats']) for broadcast in self._notifications)
+            return web.json_response({'success': True, 'broadcasts': page, 'pending': pending})
+        return await self._fail_or(build)
+    
+    async def _status_bulk(self, request: web.Request) -> web.Response:
+        updates = (await request.json()).get('updates', [])
+        
+        def build():
+            self._count_statuses(updates)
+            return web.json_response({'success': True, 'updated': len(updates)})
+        return await self._fail_or(build)
+    
+    async def _status(self, request: web.Request) -> web.Response:
+        update = await request.json()
+        
+        def build():
+            self._count_statuses([update])
+            return web.json_response({'success': True})
+        return await self._fail_or(build)
+    
+    def _count_statuses(self, updates: List[dict]) -> None:
+        for update in updates:
+            if update.get('status') == 'sent':
+                self.acknowledged += 1
+            else:
+                self.failed += 1
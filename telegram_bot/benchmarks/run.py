@@ -0,0 +1,363 @@
+"""
+Benchmark the bot's real handlers against local fake Telegram and backend services
+    
+    python benchmarks/run.py --users 10000
+    python benchmarks/run.py --users 100000 --telegram-latency 0.05 --compare benchmarks/results/<file>.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fakes import FakeBackend, FakeTelegramAPI, FaultInjector  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+SCHEDULE_BUTTONS = ['📅 Сегодня', '📅 Завтра', '📆 Неделя']
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: List[float], elapsed: float, **extra) -> dict:
+    """Throughput and latency percentiles of one scenario"""
+    return {
+        'updates': len(latencies),
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0.0) * 1000, 2),
+        **extra,
+    }
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=BENCHMARKS_DIR, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=BENCHMARKS_DIR).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class UpdateFactory:
+    """Telegram update payloads from synthetic users"""
+    
+    def __init__(self):
+        self._update_id = 0
+        self._message_id = 0
+    
+    def _ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+    
+    def message(self, user_id: int, text: str) -> dict:
+        update_id, message_id = self._ids()
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+    
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id, message_id = self._ids()
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'Benchmark'},
+                'text': '...',
+            },
+        }}
+
+
+class Benchmark:
+    def __init__(self, bot, application, telegram: FakeTelegramAPI, backend: FakeBackend, args):
+        self.bot = bot
+        self.application = application
+        self.telegram = telegram
+        self.backend = backend
+        self.args = args
+        self.updates = UpdateFactory()
+        self.random = random.Random(args.seed)
+    
+    async def process(self, payload: dict) -> float:
+        """Run one update through the application's handlers; returns its duration"""
+        from telegram import Update
+        update = Update.de_json(payload, self.application.bot)
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        return time.perf_counter() - started
+    
+    async def run_concurrently(self, jobs, concurrency: int) -> List:
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(job):
+            async with semaphore:
+                return await job()
+        return await asyncio.gather(*(run(job) for job in jobs))
+    
+    async def populate(self) -> Dict[str, List[int]]:
+        """Register the synthetic population directly in the user store; returns chats per group"""
+        store = self.bot.user_data_store
+        by_group: Dict[str, List[int]] = {}
+        teachers = self.backend.teachers
+        for user_id in range(1, self.args.users + 1):
+            if user_id % 50 == 0:
+                teacher_id, name = teachers[user_id % len(teachers)]
+                store[user_id] = {'role': 'teacher', 'teacher_id': teacher_id, 'name': name,
+                                  'telegram_id': user_id, 'chat_id': user_id}
+                continue
+            group = self.backend.groups[user_id % len(self.backend.groups)]
+            store[user_id] = {'role': 'student', 'group': group, 'subgroup': 'all', 'name': f"Студент {user_id}",
+                              'telegram_id': user_id, 'chat_id': user_id}
+            by_group.setdefault(group, []).append(user_id)
+        await store.flush()
+        return by_group
+    
+    async def schedule_requests(self) -> dict:
+        """Menu schedule requests of random registered users"""
+        users = [self.random.randint(1, self.args.users) for _ in range(self.args.requests)]
+        jobs = [
+            (lambda user_id=user_id: self.process(self.updates.message(user_id, self.random.choice(SCHEDULE_BUTTONS))))
+            for user_id in users
+        ]
+        backend_before = self.backend.faults.requests
+        started = time.perf_counter()
+        latencies = await self.run_concurrently(jobs, self.args.concurrency)
+        elapsed = time.perf_counter() - started
+        return summarize(latencies, elapsed, backend_requests=self.backend.faults.requests - backend_before)
+    
+    async def registrations(self) -> dict:
+        """Full student registration conversations of new users"""
+        step_latencies: List[float] = []
+        first_new = self.args.users + 1
+        groups = self.backend.groups
+        
+        async def register(user_id: int) -> float:
+            started = time.perf_counter()
+            for payload in (
+                self.updates.message(user_id, '/start'),
+                self.updates.callback(user_id, 'role_student'),
+                self.updates.message(user_id, groups[user_id % len(groups)]),
+                self.updates.message(user_id, self.random.choice(['1', '2', 'Вся группа'])),
+                self.updates.message(user_id, f"Студент {user_id}"),
+            ):
+                step_latencies.append(await self.process(payload))
+            return time.perf_counter() - started
+        
+        jobs = [(lambda user_id=user_id: register(user_id))
+                for user_id in range(first_new, first_new + self.args.registrations)]
+        started = time.perf_counter()
+        totals = await self.run_concurrently(jobs, self.args.concurrency)
+        elapsed = time.perf_counter() - started
+        completed = sum(1 for user_id in range(first_new, first_new + self.args.registrations)
+                        if user_id in self.bot.user_data_store)
+        return summarize(step_latencies, elapsed, registrations=completed,
+                         registration_p50_ms=round(percentile(totals, 0.5) * 1000, 2),
+                         registration_p99_ms=round(percentile(totals, 0.99) * 1000, 2))
+    
+    async def notifications(self, by_group: Dict[str, List[int]]) -> dict:
+        """Drain a queue of grouped change notifications through the notification poller"""
+        recipients, total = {}, 0
+        for group, chat_ids in by_group.items():
+            if total >= self.args.notifications:
+                break
+            chat_ids = chat_ids[:self.args.notifications - total]
+            recipients[group] = chat_ids
+            total += len(chat_ids)
+        queued = self.backend.queue_broadcasts(recipients)
+        
+        sent_before = self.telegram.messages_sent
+        started = time.perf_counter()
+        deadline = started + self.args.drain_timeout
+        # Like the process_notifications job, but polling again right away instead of after its delay
+        while True:
+            await self.bot.notification_poller.poll(self.application.bot)
+            if not self.backend.queued or time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.1)
+        await self.bot.status_batcher.flush()
+        elapsed = time.perf_counter() - started
+        sent = self.telegram.messages_sent - sent_before
+        return {
+            'notifications': queued,
+            'undelivered_broadcasts': self.backend.queued,
+            'sent': sent,
+            'acknowledged': self.backend.acknowledged,
+            'failed': self.backend.failed,
+            'seconds': round(elapsed, 3),
+            'drain_rate': round(sent / elapsed, 1) if elapsed else 0.0,
+        }
+    
+    def json_decode(self) -> dict:
+        """CPU time per backend schedule response: standard library json vs the bot's codec"""
+        # Bodies as the backend sends them (aiohttp escapes non-ASCII by default)
+        bodies = [json.dumps(self.backend._period_body('week', sessions, None)).encode()
+                  for sessions in self.backend.sessions_by_group.values()]
+        timings = {}
+        for name, loads in (('json', json.loads), (self.bot.JSON_CODEC, self.bot.json_loads)):
+            started = time.process_time()
+            for _ in range(self.args.decode_rounds):
+                for body in bodies:
+                    loads(body)
+            timings[name] = (time.process_time() - started) / (self.args.decode_rounds * len(bodies))
+        stdlib, codec = timings['json'], timings[self.bot.JSON_CODEC]
+        return {
+            'codec': self.bot.JSON_CODEC,
+            'responses': len(bodies),
+            'bytes_avg': sum(map(len, bodies)) // len(bodies),
+            'json_us': round(stdlib * 1e6, 1),
+            'codec_us': round(codec * 1e6, 1),
+            'saved_us_per_response': round((stdlib - codec) * 1e6, 1),
+        }
+
+
+async def run(args) -> dict:
+    telegram = FakeTelegramAPI(FaultInjector(args.telegram_latency, args.telegram_jitter, args.telegram_error_rate,
+                                             args.seed))
+    groups = max(1, args.users // args.group_size)
+    backend = FakeBackend(FaultInjector(args.backend_latency, args.backend_jitter, args.backend_error_rate, args.seed),
+                          groups=groups, teachers=max(1, groups // 2), seed=args.seed)
+    await telegram.start()
+    await backend.start()
+    
+    # bot.py reads its configuration at import time
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCHMARK',
+        'TELEGRAM_API_BASE_URL': telegram.url,
+        'BACKEND_URL': backend.url,
+        'USER_STORE_BACKEND': 'memory',
+        'NOTIFICATION_PUSH_PORT': '0',
+        'METRICS_PORT': '0',
+    })
+    if args.telegram_rate:
+        os.environ['TELEGRAM_GLOBAL_RATE'] = str(args.telegram_rate)
+    import bot
+    
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    
+    application = bot.build_application()
+    await application.initialize()
+    benchmark = Benchmark(bot, application, telegram, backend, args)
+    scenarios = {}
+    try:
+        started = time.perf_counter()
+        by_group = await benchmark.populate()
+        scenarios['populate'] = {'users': args.users, 'groups': groups,
+                                 'seconds': round(time.perf_counter() - started, 3)}
+        print(f"Populated {args.users} users in {groups} groups", flush=True)
+        
+        for label in ('schedule_cold', 'schedule_warm'):
+            scenarios[label] = await benchmark.schedule_requests()
+            print(f"{label}: {scenarios[label]}", flush=True)
+        if args.registrations:
+            scenarios['registration'] = await benchmark.registrations()
+            print(f"registration: {scenarios['registration']}", flush=True)
+        if args.notifications:
+            scenarios['notifications'] = await benchmark.notifications(by_group)
+            print(f"notifications: {scenarios['notifications']}", flush=True)
+        if args.decode_rounds:
+            scenarios['json_decode'] = benchmark.json_decode()
+            print(f"json_decode: {scenarios['json_decode']}", flush=True)
+    finally:
+        await application.shutdown()
+        await bot.shutdown(application)
+        await telegram.stop()
+        await backend.stop()
+    
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'output', 'verbose')},
+        'scenarios': scenarios,
+    }
+
+
+def compare(result: dict, baseline: dict) -> None:
+    """Print metrics side by side with an earlier run"""
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, metrics in result['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name, {})
+        for key, value in metrics.items():
+            old = base.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old:+.1%}" if old else 'n/a'
+            print(f"  {name}.{key}: {old} -> {value} ({change})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000, help='synthetic registered users')
+    parser.add_argument('--group-size', type=int, default=25, help='students per group')
+    parser.add_argument('--requests', type=int, default=5000, help='schedule requests per pass')
+    parser.add_argument('--registrations', type=int, default=500, help='new users going through registration')
+    parser.add_argument('--notifications', type=int, default=1000, help='notification deliveries to drain')
+    parser.add_argument('--decode-rounds', type=int, default=20,
+                        help='passes over all week schedule bodies when timing JSON decoding (0 skips it)')
+    parser.add_argument('--drain-timeout', type=float, default=600, help='longest notification drain, seconds')
+    parser.add_argument('--concurrency', type=int, default=32, help='updates processed at once')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='fake Bot API latency, seconds')
+    parser.add_argument('--telegram-jitter', type=float, default=0.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help='share of Bot API calls failing with 502')
+    parser.add_argument('--telegram-rate', type=float, default=0.0,
+                        help='override TELEGRAM_GLOBAL_RATE for the notification drain (0 keeps the bot default)')
+    parser.add_argument('--backend-latency', type=float, default=0.0, help='fake backend latency, seconds')
+    parser.add_argument('--backend-jitter', type=float, default=0.0)
+    parser.add_argument('--backend-error-rate', type=float, default=0.0, help='share of backend calls failing with 500')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    parser.add_argument('--verbose', action='store_true', help='keep the bot INFO logs')
+    args = parser.parse_args()
+    
+    result = asyncio.run(run(args))
+    
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{result['commit']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {output}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
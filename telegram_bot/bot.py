@@ -2,17 +2,38 @@
 """Smart University Schedule Telegram Bot"""
 
 import os
+import re
+import hmac
+import signal
+import json
+import time
+import heapq
+import itertools
+import random
+import socket
+import secrets
+import sqlite3
+import threading
+import weakref
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import functools
+import multiprocessing
+from collections import OrderedDict, deque
+from bisect import bisect_left
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import aiohttp
+from aiohttp import web
 from dotenv import load_dotenv
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    Message,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
 )
@@ -21,10 +42,18 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     ConversationHandler,
     filters,
     ContextTypes,
 )
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library codec is used without it
+    orjson = None
 
 # Load environment variables
 load_dotenv()
@@ -42,13 +71,1488 @@ BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:3000')
 WEBHOOK_API_KEY = os.getenv('WEBHOOK_API_KEY', '')
 ADMIN_IDS = [int(uid) for uid in os.getenv('ADMIN_USER_IDS', '').split(',') if uid]
 NOTIFICATION_CHECK_INTERVAL = int(os.getenv('NOTIFICATION_CHECK_INTERVAL', '30'))
+# Each bot process claims notification batches under its own id for NOTIFICATION_LEASE_SECONDS,
+# so several processes can poll one backend without sending anything twice
+NOTIFICATION_WORKER_ID = os.getenv('NOTIFICATION_WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+NOTIFICATION_LEASE_SECONDS = int(os.getenv('NOTIFICATION_LEASE_SECONDS', '120'))
+
+# Notification dispatch configuration (rates in messages per second)
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', '8'))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+NOTIFICATION_MAX_RETRIES = int(os.getenv('NOTIFICATION_MAX_RETRIES', '3'))
+STATUS_BATCH_SIZE = int(os.getenv('STATUS_BATCH_SIZE', '100'))
+STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', '2'))
+# Transient send errors: exponential backoff, then the chat's circuit breaker opens
+NOTIFICATION_RETRY_BASE = float(os.getenv('NOTIFICATION_RETRY_BASE', '1'))
+NOTIFICATION_RETRY_MAX = float(os.getenv('NOTIFICATION_RETRY_MAX', '60'))
+NOTIFICATION_MAX_DEFERRALS = int(os.getenv('NOTIFICATION_MAX_DEFERRALS', '10'))
+CHAT_BREAKER_THRESHOLD = int(os.getenv('CHAT_BREAKER_THRESHOLD', '3'))
+CHAT_BREAKER_COOLDOWN = float(os.getenv('CHAT_BREAKER_COOLDOWN', '120'))
+# Identical messages to the same chat within this many seconds are sent once
+NOTIFICATION_DEDUPE_WINDOW = int(os.getenv('NOTIFICATION_DEDUPE_WINDOW', '600'))
+
+# Adaptive notification polling (NOTIFICATION_CHECK_INTERVAL is the idle back-off ceiling)
+NOTIFICATION_MIN_INTERVAL = float(os.getenv('NOTIFICATION_MIN_INTERVAL', '1'))
+NOTIFICATION_PAGE_SIZE = int(os.getenv('NOTIFICATION_PAGE_SIZE', '50'))
+NOTIFICATION_MIN_PAGE_SIZE = int(os.getenv('NOTIFICATION_MIN_PAGE_SIZE', '10'))
+NOTIFICATION_MAX_PAGE_SIZE = int(os.getenv('NOTIFICATION_MAX_PAGE_SIZE', '500'))
+NOTIFICATION_PAGE_TARGET_SECONDS = float(os.getenv('NOTIFICATION_PAGE_TARGET_SECONDS', '10'))
+
+# Push intake: backend POSTs new notifications here (0 disables the receiver)
+NOTIFICATION_PUSH_HOST = os.getenv('NOTIFICATION_PUSH_HOST', '127.0.0.1')
+NOTIFICATION_PUSH_PORT = int(os.getenv('NOTIFICATION_PUSH_PORT', '0'))
+NOTIFICATION_PUSH_QUEUE_SIZE = int(os.getenv('NOTIFICATION_PUSH_QUEUE_SIZE', '10000'))
+
+# Backend HTTP connection pool configuration (timeouts in seconds)
+BACKEND_POOL_LIMIT = int(os.getenv('BACKEND_POOL_LIMIT', '100'))
+BACKEND_POOL_LIMIT_PER_HOST = int(os.getenv('BACKEND_POOL_LIMIT_PER_HOST', '50'))
+BACKEND_KEEPALIVE_TIMEOUT = float(os.getenv('BACKEND_KEEPALIVE_TIMEOUT', '30'))
+BACKEND_DNS_TTL = int(os.getenv('BACKEND_DNS_TTL', '300'))
+BACKEND_CONNECT_TIMEOUT = float(os.getenv('BACKEND_CONNECT_TIMEOUT', '3'))
+BACKEND_READ_TIMEOUT = float(os.getenv('BACKEND_READ_TIMEOUT', '10'))
+BACKEND_TOTAL_TIMEOUT = float(os.getenv('BACKEND_TOTAL_TIMEOUT', '15'))
+BACKEND_HTTP_COMPRESSION = os.getenv('BACKEND_HTTP_COMPRESSION', 'true').lower() == 'true'
+# Decode backend and Telegram responses with orjson when it is installed
+FAST_JSON = os.getenv('FAST_JSON', 'true').lower() == 'true'
+# Prometheus metrics endpoint (0 disables it); binds to localhost unless told otherwise
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Backend circuit breaker: failures in a row before failing fast, seconds before a probe call,
+# and a cap on concurrent backend calls (with the longest wait for a free slot)
+BACKEND_BREAKER_THRESHOLD = int(os.getenv('BACKEND_BREAKER_THRESHOLD', '5'))
+BACKEND_BREAKER_RESET = float(os.getenv('BACKEND_BREAKER_RESET', '30'))
+BACKEND_MAX_INFLIGHT = int(os.getenv('BACKEND_MAX_INFLIGHT', '20'))
+BACKEND_QUEUE_TIMEOUT = float(os.getenv('BACKEND_QUEUE_TIMEOUT', '2'))
+
+# Update intake: 'polling' or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '32'))
+# Most updates accepted but not handled yet (queued or waiting for a handler slot)
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+# Alternative Bot API server, e.g. a local fake for load testing (http://localhost:8081)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')
+TELEGRAM_WEBHOOK_LISTEN = os.getenv('TELEGRAM_WEBHOOK_LISTEN', '0.0.0.0')
+TELEGRAM_WEBHOOK_PORT = int(os.getenv('TELEGRAM_WEBHOOK_PORT', '8443'))
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', 'telegram')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_WEBHOOK_MAX_CONNECTIONS', '40'))
+# The bot only handles messages and inline button presses
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+# Supervisor mode: worker processes handling updates (1 = everything in one process). Updates are
+# routed by user id, so a user's conversation always lands on the same worker. Workers listen on
+# consecutive local ports and re-read users and dead chats written by the others every few seconds.
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+BOT_WORKER_BASE_PORT = int(os.getenv('BOT_WORKER_BASE_PORT', '8300'))
+BOT_WORKER_SYNC_INTERVAL = float(os.getenv('BOT_WORKER_SYNC_INTERVAL', '10'))
+
+# Persistent user store
+USER_STORE_BACKEND = os.getenv('USER_STORE_BACKEND', 'sqlite')
+USER_STORE_PATH = os.getenv('USER_STORE_PATH', 'users.db')
+USER_STORE_HOT_SIZE = int(os.getenv('USER_STORE_HOT_SIZE', '10000'))
+USER_STORE_FLUSH_INTERVAL = float(os.getenv('USER_STORE_FLUSH_INTERVAL', '5'))
+
+# Schedule cache configuration (TTL values in seconds)
+SCHEDULE_CACHE_SIZE = int(os.getenv('SCHEDULE_CACHE_SIZE', '2048'))
+SCHEDULE_CACHE_TTL = {
+    'today': int(os.getenv('SCHEDULE_CACHE_TTL_TODAY', '60')),
+    'tomorrow': int(os.getenv('SCHEDULE_CACHE_TTL_TOMORROW', '300')),
+    'week': int(os.getenv('SCHEDULE_CACHE_TTL_WEEK', '600')),
+}
+SCHEDULE_CACHE_STALE_TTL = int(os.getenv('SCHEDULE_CACHE_STALE_TTL', '600'))
+
+# Local schedule snapshots (full reload interval in seconds)
+SCHEDULE_SNAPSHOT_TTL = int(os.getenv('SCHEDULE_SNAPSHOT_TTL', '900'))
+SCHEDULE_SNAPSHOT_MAX_OWNERS = int(os.getenv('SCHEDULE_SNAPSHOT_MAX_OWNERS', '1000'))
+
+# Rendered message caches (entries)
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '4096'))
+
+# Group/teacher directory used during registration
+DIRECTORY_TTL = int(os.getenv('DIRECTORY_TTL', '3600'))
+DIRECTORY_PAGE_SIZE = int(os.getenv('DIRECTORY_PAGE_SIZE', '8'))
+
+# Schedule prefetch before peak hours: "HH:MM=period" entries in local time
+PREFETCH_SCHEDULE = os.getenv('PREFETCH_SCHEDULE', '07:00=today,19:00=tomorrow')
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '4'))
+PREFETCH_JITTER = float(os.getenv('PREFETCH_JITTER', '30'))
+
+# Proactive "next class" reminders (0 disables)
+REMINDER_MINUTES = int(os.getenv('REMINDER_MINUTES', '15'))
+REMINDER_TICK = int(os.getenv('REMINDER_TICK', '20'))
+REMINDER_REFRESH_INTERVAL = int(os.getenv('REMINDER_REFRESH_INTERVAL', '600'))
+
+# University local time zone; schedule times are shown and days are split in it
+SCHEDULE_TIMEZONE = os.getenv('SCHEDULE_TIMEZONE', 'Asia/Yekaterinburg')
+LOCAL_TZ = ZoneInfo(SCHEDULE_TIMEZONE)
 
 # Conversation states
 CHOOSE_ROLE, STUDENT_GROUP, STUDENT_SUBGROUP, STUDENT_NAME = range(4)
 TEACHER_SELECT = range(1)
 
-# User data storage (in production, use a database)
-user_data_store: Dict[int, dict] = {}
+# JSON codec for backend calls, Telegram responses, routed updates and stored user records.
+# Both variants take str or bytes and produce the same data.
+if FAST_JSON and orjson is not None:
+    JSON_CODEC = 'orjson'
+    json_loads = orjson.loads
+    
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    JSON_CODEC = 'json'
+    json_loads = json.loads
+    json_dumps = functools.partial(json.dumps, ensure_ascii=False)
+
+
+class MemoryUserBackend:
+    """Non-persistent user backend (data is lost on restart)"""
+    
+    def __init__(self):
+        self._records: Dict[int, dict] = {}
+    
+    def load_index(self) -> List[Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str]]]:
+        return [
+            (user_id, r.get('role'), r.get('group'), r.get('subgroup'), r.get('teacher_id'))
+            for user_id, r in self._records.items()
+        ]
+    
+    def load(self, user_id: int) -> Optional[dict]:
+        record = self._records.get(user_id)
+        return dict(record) if record is not None else None
+    
+    def load_many(self, user_ids: List[int]) -> Dict[int, dict]:
+        return {i: dict(self._records[i]) for i in user_ids if i in self._records}
+    
+    def save_many(self, records: List[dict], deleted: Iterable[int]) -> None:
+        for record in records:
+            self._records[record['telegram_id']] = dict(record)
+        for user_id in deleted:
+            self._records.pop(user_id, None)
+    
+    def load_changed(self, since: float) -> List[Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str]]]:
+        return []
+    
+    def load_deleted(self, since: float) -> List[int]:
+        return []
+    
+    def load_dead_chats(self) -> Dict[str, str]:
+        return {}
+    
+    def save_dead_chat(self, chat_id: str, reason: Optional[str]) -> None:
+        pass
+    
+    def close(self) -> None:
+        pass
+
+
+class SQLiteUserBackend:
+    """SQLite user backend with indexed group and teacher columns"""
+    
+    # Deletion tombstones only have to outlive the workers' sync interval
+    TOMBSTONE_TTL = 86400
+    
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS users ('
+                'telegram_id INTEGER PRIMARY KEY, role TEXT, grp TEXT, subgroup TEXT, '
+                'teacher_id TEXT, chat_id INTEGER, data TEXT NOT NULL, updated_at REAL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_users_group ON users(grp, subgroup)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_users_teacher ON users(teacher_id)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS deleted_users (telegram_id INTEGER PRIMARY KEY, deleted_at REAL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_deleted_users_at ON deleted_users(deleted_at)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS dead_chats (chat_id TEXT PRIMARY KEY, reason TEXT, since REAL)'
+            )
+    
+    def load_index(self) -> List[Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str]]]:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT telegram_id, role, grp, subgroup, teacher_id FROM users'
+            ).fetchall()
+    
+    def load(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM users WHERE telegram_id = ?', (user_id,)).fetchone()
+        return json_loads(row[0]) if row else None
+    
+    def load_many(self, user_ids: List[int]) -> Dict[int, dict]:
+        """Records of several users, read in chunks under SQLite's bound parameter limit"""
+        rows = []
+        with self._lock:
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                rows += self._conn.execute(
+                    f"SELECT telegram_id, data FROM users WHERE telegram_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        return {user_id: json_loads(data) for user_id, data in rows}
+    
+    def save_many(self, records: List[dict], deleted: Iterable[int]) -> None:
+        now = time.time()
+        deleted = [(i,) for i in deleted]
+        rows = [
+            (
+                r['telegram_id'], r.get('role'), r.get('group'), r.get('subgroup'),
+                r.get('teacher_id'), r.get('chat_id'), json_dumps(r), now,
+            )
+            for r in records
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO users '
+                '(telegram_id, role, grp, subgroup, teacher_id, chat_id, data, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            # A user registering again is no longer deleted
+            self._conn.executemany('DELETE FROM deleted_users WHERE telegram_id = ?', [r[:1] for r in rows])
+            self._conn.executemany('DELETE FROM users WHERE telegram_id = ?', deleted)
+            # Other processes learn about deletions from tombstones
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO deleted_users (telegram_id, deleted_at) VALUES (?, ?)',
+                [(i, now) for i, in deleted]
+            )
+            self._conn.execute('DELETE FROM deleted_users WHERE deleted_at < ?', (now - self.TOMBSTONE_TTL,))
+    
+    def load_changed(self, since: float) -> List[Tuple[int, Optional[str], Optional[str], Optional[str], Optional[str]]]:
+        """Index rows saved after the given time (e.g. by another process)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT telegram_id, role, grp, subgroup, teacher_id FROM users WHERE updated_at >= ?', (since,)
+            ).fetchall()
+    
+    def load_deleted(self, since: float) -> List[int]:
+        """Ids of users deleted after the given time"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT telegram_id FROM deleted_users WHERE deleted_at >= ?', (since,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def load_dead_chats(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute('SELECT chat_id, reason FROM dead_chats').fetchall())
+    
+    def save_dead_chat(self, chat_id: str, reason: Optional[str]) -> None:
+        """Add a dead chat, or remove it when reason is None"""
+        with self._lock, self._conn:
+            if reason is None:
+                self._conn.execute('DELETE FROM dead_chats WHERE chat_id = ?', (chat_id,))
+            else:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO dead_chats (chat_id, reason, since) VALUES (?, ?, ?)',
+                    (chat_id, reason, time.time())
+                )
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class UserStore:
+    """User records with an in-memory hot set, group/teacher indexes and write-behind persistence"""
+    
+    def __init__(self, backend, hot_size: int):
+        self.backend = backend
+        self.hot_size = hot_size
+        # Clean records in LRU order; changed records wait in _dirty (and _flushing while being
+        # written) and are never evicted, so eviction never has to skip over them
+        self._hot: 'OrderedDict[int, dict]' = OrderedDict()
+        self._meta: Dict[int, Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]] = {}
+        self._by_group: Dict[str, Set[int]] = {}
+        self._by_teacher: Dict[str, Set[int]] = {}
+        self._dirty: Dict[int, dict] = {}
+        self._flushing: Dict[int, dict] = {}
+        self._deleted: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._synced_at = time.time()
+        
+        # Only the small index is read at startup; full records are loaded on first access
+        for user_id, role, group, subgroup, teacher_id in backend.load_index():
+            self._index(user_id, role, group, subgroup, teacher_id)
+        logger.info(f"User store ready: {len(self._meta)} users indexed")
+    
+    def _index(self, user_id: int, role, group, subgroup, teacher_id) -> None:
+        self._meta[user_id] = (role, group, subgroup, teacher_id)
+        if group:
+            self._by_group.setdefault(group, set()).add(user_id)
+        if teacher_id:
+            self._by_teacher.setdefault(teacher_id, set()).add(user_id)
+    
+    def _unindex(self, user_id: int) -> None:
+        meta = self._meta.pop(user_id, None)
+        if meta is None:
+            return
+        _, group, _, teacher_id = meta
+        if group and group in self._by_group:
+            self._by_group[group].discard(user_id)
+            if not self._by_group[group]:
+                del self._by_group[group]
+        if teacher_id and teacher_id in self._by_teacher:
+            self._by_teacher[teacher_id].discard(user_id)
+            if not self._by_teacher[teacher_id]:
+                del self._by_teacher[teacher_id]
+    
+    def _evict(self) -> None:
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+    
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._meta
+    
+    def __len__(self) -> int:
+        return len(self._meta)
+    
+    def __getitem__(self, user_id: int) -> dict:
+        record = self.get(user_id)
+        if record is None:
+            raise KeyError(user_id)
+        return record
+    
+    def _cached(self, user_id: int) -> Optional[dict]:
+        record = self._dirty.get(user_id) or self._flushing.get(user_id)
+        if record is None:
+            record = self._hot.get(user_id)
+            if record is not None:
+                self._hot.move_to_end(user_id)
+        return record
+    
+    def get(self, user_id: int, default: Optional[dict] = None) -> Optional[dict]:
+        """Get a user record, loading it into the hot set if needed"""
+        if user_id not in self._meta:
+            return default
+        record = self._cached(user_id)
+        if record is None:
+            record = self.backend.load(user_id)
+            if record is None:
+                return default
+            self._hot[user_id] = record
+            self._evict()
+        return record
+    
+    async def get_many(self, user_ids: Iterable[int]) -> Dict[int, dict]:
+        """Records of several users; the ones not in memory are read in one batch off the event loop"""
+        records: Dict[int, dict] = {}
+        cold = []
+        for user_id in user_ids:
+            if user_id not in self._meta:
+                continue
+            record = self._cached(user_id)
+            if record is None:
+                cold.append(user_id)
+            else:
+                records[user_id] = record
+        if not cold:
+            return records
+        
+        loaded = await asyncio.to_thread(self.backend.load_many, cold)
+        for user_id, record in loaded.items():
+            # Skip users deleted while the batch was read, and prefer records changed meanwhile
+            if user_id not in self._meta:
+                continue
+            current = self._cached(user_id)
+            if current is None:
+                current = self._hot[user_id] = record
+            records[user_id] = current
+        self._evict()
+        return records
+    
+    def __setitem__(self, user_id: int, record: dict) -> None:
+        record['telegram_id'] = user_id
+        self._unindex(user_id)
+        self._index(user_id, record.get('role'), record.get('group'), record.get('subgroup'), record.get('teacher_id'))
+        self._hot.pop(user_id, None)
+        self._dirty[user_id] = record
+        self._deleted.discard(user_id)
+    
+    def __delitem__(self, user_id: int) -> None:
+        if user_id not in self._meta:
+            raise KeyError(user_id)
+        self._unindex(user_id)
+        self._hot.pop(user_id, None)
+        self._dirty.pop(user_id, None)
+        self._deleted.add(user_id)
+    
+    def update(self, user_id: int, **fields) -> None:
+        """Change fields of an existing record and schedule it for persistence"""
+        record = dict(self[user_id])
+        record.update(fields)
+        self[user_id] = record
+    
+    def ids_in_group(self, group: str, subgroup: Optional[str] = None) -> Set[int]:
+        """Telegram ids of students of a group (optionally only those seeing a subgroup)"""
+        ids = self._by_group.get(group, set())
+        if subgroup is None:
+            return set(ids)
+        return {i for i in ids if self._meta[i][2] in (subgroup, 'all')}
+    
+    def ids_for_teacher(self, teacher_id: str) -> Set[int]:
+        """Telegram ids registered as the given teacher"""
+        return set(self._by_teacher.get(teacher_id, set()))
+    
+    def group_subgroups(self) -> Dict[str, Set[str]]:
+        """Groups with students and the subgroups they use"""
+        result: Dict[str, Set[str]] = {}
+        for role, group, subgroup, _ in self._meta.values():
+            if role == 'student' and group:
+                result.setdefault(group, set()).add(subgroup or 'all')
+        return result
+    
+    def teacher_ids(self) -> Set[str]:
+        """Teacher ids with at least one registered user"""
+        return set(self._by_teacher)
+    
+    async def flush(self) -> None:
+        """Write changed and deleted records to the backend"""
+        async with self._flush_lock:
+            if not self._dirty and not self._deleted:
+                return
+            self._flushing, deleted = self._dirty, self._deleted
+            self._dirty, self._deleted = {}, set()
+            records = [dict(record) for record in self._flushing.values()]
+            try:
+                await asyncio.to_thread(self.backend.save_many, records, deleted)
+            except Exception as e:
+                logger.error(f"Failed to persist user store: {e}")
+                for user_id, record in self._flushing.items():
+                    if user_id in self._meta:
+                        self._dirty.setdefault(user_id, record)
+                self._deleted |= {i for i in deleted if i not in self._meta}
+                return
+            finally:
+                flushed, self._flushing = self._flushing, {}
+            # Saved records join the clean LRU unless changed or deleted during the write
+            for user_id, record in flushed.items():
+                if user_id in self._meta and user_id not in self._dirty:
+                    self._hot[user_id] = record
+            self._evict()
+    
+    async def sync(self) -> int:
+        """Re-index records other processes saved or deleted since the last sync; returns how many changed"""
+        # Small overlap so that writes committed while the previous query ran are not missed
+        since, self._synced_at = self._synced_at - 1, time.time()
+        rows = await asyncio.to_thread(self.backend.load_changed, since)
+        deleted = await asyncio.to_thread(self.backend.load_deleted, since)
+        changed = 0
+        for user_id in deleted:
+            # Locally changed records were registered again after the deletion
+            if user_id in self._dirty or user_id not in self._meta:
+                continue
+            self._unindex(user_id)
+            self._hot.pop(user_id, None)
+            changed += 1
+        for user_id, role, group, subgroup, teacher_id in rows:
+            if user_id in self._dirty:
+                continue
+            # The cached record may be outdated; it is reloaded on next access
+            self._hot.pop(user_id, None)
+            if self._meta.get(user_id) != (role, group, subgroup, teacher_id):
+                self._unindex(user_id)
+                self._index(user_id, role, group, subgroup, teacher_id)
+                changed += 1
+        return changed
+    
+    async def close(self) -> None:
+        """Flush pending writes and close the backend"""
+        await self.flush()
+        self.backend.close()
+
+
+def create_user_backend():
+    """Create the user backend configured by USER_STORE_BACKEND"""
+    if USER_STORE_BACKEND == 'memory':
+        return MemoryUserBackend()
+    if USER_STORE_BACKEND == 'sqlite':
+        return SQLiteUserBackend(USER_STORE_PATH)
+    raise ValueError(f"Unknown USER_STORE_BACKEND: {USER_STORE_BACKEND}")
+
+
+# User data storage
+user_data_store = UserStore(create_user_backend(), USER_STORE_HOT_SIZE)
+
+
+class DeadChats:
+    """Dead-letter set of chats that can't receive messages (bot blocked, chat deleted or not found)"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self._chats = backend.load_dead_chats()
+    
+    def __contains__(self, chat_id: str) -> bool:
+        return chat_id in self._chats
+    
+    def __len__(self) -> int:
+        return len(self._chats)
+    
+    def add(self, chat_id: str, reason: str) -> None:
+        if chat_id not in self._chats:
+            self._chats[chat_id] = reason
+            # Rare event, a single-row write
+            self.backend.save_dead_chat(chat_id, reason)
+    
+    def discard(self, chat_id: str) -> None:
+        if self._chats.pop(chat_id, None) is not None:
+            self.backend.save_dead_chat(chat_id, None)
+    
+    async def sync(self) -> None:
+        """Pick up chats added or revived by other processes"""
+        self._chats = await asyncio.to_thread(self.backend.load_dead_chats)
+
+
+dead_chats = DeadChats(user_data_store.backend)
+
+
+class ScheduleCache:
+    """In-process LRU cache for schedule responses with stale-while-revalidate"""
+    
+    def __init__(self, max_size: int, ttl: Dict[str, int], stale_ttl: int, default_ttl: int = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.default_ttl = default_ttl
+        self._entries: 'OrderedDict[Tuple, Tuple[float, dict]]' = OrderedDict()
+        self._refreshing: Dict[Tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(kind: str, owner: str, period: str, subgroup: Optional[str] = None) -> Tuple:
+        """Build a cache key; the date is included so 'today' never survives midnight"""
+        return (kind, owner, period, subgroup, datetime.now(LOCAL_TZ).date().isoformat())
+    
+    def _ttl_for(self, key: Tuple) -> int:
+        return self.ttl.get(key[2], self.default_ttl)
+    
+    def get(self, key: Tuple) -> Tuple[Optional[dict], bool]:
+        """Return (value, is_fresh) for a key; value is None if missing or fully expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        ttl = self._ttl_for(key)
+        if age > ttl + self.stale_ttl:
+            # Kept until evicted: still good enough for degraded answers
+            return None, False
+        
+        self._entries.move_to_end(key)
+        return value, age <= ttl
+    
+    def peek(self, key: Tuple, count_hit: bool = True) -> Tuple[Optional[dict], bool, float]:
+        """Return (value, is_fresh, age in seconds) without triggering refreshes"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False, 0.0
+        value, fresh = self.get(key)
+        # Misses are counted by the fetch that follows
+        if value is not None and count_hit:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return value, fresh, time.monotonic() - entry[0]
+    
+    def last_good(self, key: Tuple) -> Tuple[Optional[dict], float]:
+        """Last successful value for a key however old it is, with its age in seconds"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, 0.0
+        return entry[1], time.monotonic() - entry[0]
+    
+    def set(self, key: Tuple, value: dict) -> None:
+        """Store a value, evicting least recently used entries over max_size"""
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, kind: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """Drop entries matching kind/owner (all entries if both are None)"""
+        keys = [
+            key for key in self._entries
+            if (kind is None or key[0] == kind) and (owner is None or key[1] == owner)
+        ]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+    
+    async def get_or_fetch(self, key: Tuple, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        """Serve from cache, refreshing stale entries in the background"""
+        value, fresh = self.get(key)
+        if value is not None:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._schedule_refresh(key, fetch)
+            return value
+        
+        self.misses += 1
+        result = await fetch()
+        if result.get('success'):
+            self.set(key, result)
+        return result
+    
+    async def refresh(self, key: Tuple, fetch: Callable[[], Awaitable[dict]]) -> Optional[dict]:
+        """Fetch a fresh value now, joining a background refresh already in flight"""
+        self._schedule_refresh(key, fetch)
+        return await asyncio.shield(self._refreshing[key])
+    
+    def _schedule_refresh(self, key: Tuple, fetch: Callable[[], Awaitable[dict]]) -> None:
+        if key in self._refreshing:
+            return
+        
+        async def refresh():
+            try:
+                result = await fetch()
+                if result.get('success'):
+                    self.set(key, result)
+                return result
+            except Exception as e:
+                logger.error(f"Background cache refresh failed for {key}: {e}")
+                return None
+            finally:
+                self._refreshing.pop(key, None)
+        
+        self._refreshing[key] = asyncio.create_task(refresh())
+    
+    async def close(self) -> None:
+        """Cancel pending background refreshes"""
+        tasks = list(self._refreshing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refreshing.clear()
+    
+    def stats(self) -> dict:
+        """Cache statistics"""
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.stale_hits) / total if total else 0.0,
+        }
+
+
+def parse_backend_time(value: str) -> datetime:
+    """Parse an ISO timestamp from backend into local time"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(LOCAL_TZ)
+
+
+def schedule_dates(today: Optional[date] = None) -> Dict[str, date]:
+    """Local dates that define the today/tomorrow/week periods"""
+    today = today or datetime.now(LOCAL_TZ).date()
+    week_start = today - timedelta(days=today.weekday())
+    return {
+        'today': today,
+        'tomorrow': today + timedelta(days=1),
+        'week_start': week_start,
+        'week_end': week_start + timedelta(days=7),
+    }
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
+class Course:
+    id: Optional[str]
+    name: str
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
+class Teacher:
+    id: Optional[str]
+    name: str
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
+class Room:
+    building: str
+    number: str
+    
+    def __str__(self) -> str:
+        return f"{self.building} {self.number}".strip()
+
+
+# Courses, teachers and rooms repeat across sessions and cached schedules; equal ones share
+# one object. Entries go away with the last session that uses them (e.g. a renamed course).
+_schedule_parts: 'weakref.WeakValueDictionary[tuple, object]' = weakref.WeakValueDictionary()
+
+
+def shared_part(cls, *fields):
+    """The one Course/Teacher/Room instance with these fields"""
+    key = (cls, *fields)
+    part = _schedule_parts.get(key)
+    if part is None:
+        part = _schedule_parts[key] = cls(*fields)
+    return part
+
+
+@dataclass(frozen=True, slots=True)
+class Session:
+    """One class with local start/end times and date computed when the backend response is read"""
+    id: Optional[str]
+    course: Optional[Course]
+    teacher: Optional[Teacher]
+    room: Room
+    start: datetime
+    end: datetime
+    day: date
+    groups: Tuple[str, ...]
+    subgroup: str
+    type: str
+    pair_number: Optional[int]
+    updated_at: Optional[str]
+    
+    @classmethod
+    def from_backend(cls, data: dict) -> 'Session':
+        start = parse_backend_time(data['startAt'])
+        course = data.get('course')
+        teacher = data.get('teacher')
+        room = data.get('room') or {}
+        if isinstance(teacher, dict):
+            teacher = shared_part(Teacher, teacher.get('_id'), teacher.get('name', 'N/A'))
+        elif teacher:
+            # Not populated: only the id is known
+            teacher = shared_part(Teacher, str(teacher), 'N/A')
+        return cls(
+            id=str(data['_id']) if data.get('_id') is not None else None,
+            course=shared_part(Course, course.get('_id'), course.get('name', 'N/A')) if isinstance(course, dict) else None,
+            teacher=teacher or None,
+            room=shared_part(Room, room.get('building') or '', room.get('number') or 'N/A'),
+            start=start,
+            end=parse_backend_time(data['endAt']),
+            day=start.date(),
+            groups=tuple(data.get('groups') or ()),
+            subgroup=data.get('subgroup') or 'all',
+            type=data.get('type') or 'lecture',
+            pair_number=data.get('pairNumber'),
+            updated_at=data.get('updatedAt'),
+        )
+    
+    @property
+    def version(self) -> tuple:
+        """Fields that identify one rendering of the session"""
+        return (self.id, self.updated_at, self.start, self.end)
+    
+    def moved(self, start: datetime, end: datetime) -> 'Session':
+        return replace(self, start=start, end=end, day=start.date())
+
+
+def parse_sessions(items: Iterable[dict]) -> List[Session]:
+    """Backend session documents as Session objects sorted by start time"""
+    sessions = []
+    for item in items:
+        try:
+            sessions.append(Session.from_backend(item))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed session from backend: {e!r}")
+    sessions.sort(key=lambda session: session.start)
+    return sessions
+
+
+def parse_schedule(data: dict) -> dict:
+    """Day or week schedule response with its sessions parsed once, in start order"""
+    if 'sessions' in data:
+        items = data['sessions']
+    else:
+        # Week responses only group sessions by date
+        items = [session for day in (data.get('schedule') or {}).values() for session in day]
+    return {'success': bool(data.get('success')), 'sessions': parse_sessions(items)}
+
+
+class ScheduleSnapshot:
+    """Materialized upcoming schedule of one group or teacher"""
+    
+    __slots__ = ('sessions', 'window_start', 'window_end', 'loaded_at', 'dirty')
+    
+    def __init__(self, sessions: List[Session], window_start: date, window_end: date):
+        # Sorted by start time (see parse_sessions)
+        self.sessions = sessions
+        self.window_start = window_start
+        self.window_end = window_end
+        self.loaded_at = time.monotonic()
+        self.dirty = False
+    
+    def session_ids(self) -> Set[str]:
+        return {session.id for session in self.sessions if session.id is not None}
+    
+    def covers(self, start: date, end: date) -> bool:
+        return self.window_start <= start and end <= self.window_end
+    
+    def select(self, start: date, end: date, subgroup: str = 'all') -> List[Session]:
+        """Sessions with local date in [start, end), filtered like the backend filters subgroups"""
+        return [
+            session for session in self.sessions
+            if start <= session.day < end
+            and (subgroup == 'all' or session.subgroup in (subgroup, 'all'))
+        ]
+
+
+class ScheduleSnapshotStore:
+    """Local materialized views of upcoming schedules, kept current from change notifications"""
+    
+    # Change set keys of an update that only moved a session
+    TIME_CHANGES = frozenset(('oldStartAt', 'newStartAt', 'oldTime', 'newTime'))
+    
+    def __init__(self, ttl: int, max_owners: int):
+        self.ttl = ttl
+        self.max_owners = max_owners
+        self._snapshots: 'OrderedDict[Tuple[str, str], ScheduleSnapshot]' = OrderedDict()
+        self._session_owners: Dict[str, Set[Tuple[str, str]]] = {}
+        self._loading: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Changes applied to owners while their load runs; the load may have read the backend before them
+        self._generations: Dict[Tuple[str, str], int] = {}
+        # Called with (kind, owner) whenever an owner's snapshot content changes
+        self.listeners: List[Callable[[str, str], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.patched = 0
+        self.invalidated = 0
+    
+    def lookup(self, kind: str, owner: str, period: str, subgroup: str = 'all',
+               count_miss: bool = True, allow_stale: bool = False) -> Optional[dict]:
+        """Build a backend-shaped response from the snapshot, or None if it can't be answered locally"""
+        snapshot = self._snapshots.get((kind, owner))
+        dates = schedule_dates()
+        if period == 'week':
+            start, end = dates['week_start'], dates['week_end']
+        elif period in ('today', 'tomorrow'):
+            start = dates[period]
+            end = start + timedelta(days=1)
+        else:
+            return None
+        
+        if snapshot is None or not snapshot.covers(start, end):
+            if count_miss:
+                self.misses += 1
+            return None
+        if not allow_stale and (snapshot.dirty or time.monotonic() - snapshot.loaded_at > self.ttl):
+            if count_miss:
+                self.misses += 1
+            return None
+        
+        self.hits += 1
+        self._snapshots.move_to_end((kind, owner))
+        return {'success': True, 'sessions': snapshot.select(start, end, subgroup)}
+    
+    def age(self, kind: str, owner: str) -> float:
+        snapshot = self._snapshots.get((kind, owner))
+        return time.monotonic() - snapshot.loaded_at if snapshot is not None else 0.0
+    
+    def store(self, kind: str, owner: str, snapshot: ScheduleSnapshot) -> None:
+        """Replace the snapshot of an owner"""
+        key = (kind, owner)
+        self._drop(key)
+        self._snapshots[key] = snapshot
+        for session_id in snapshot.session_ids():
+            self._session_owners.setdefault(session_id, set()).add(key)
+        while len(self._snapshots) > self.max_owners:
+            self._drop(next(iter(self._snapshots)))
+        self._notify(key)
+    
+    def _notify(self, key: Tuple[str, str]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(*key)
+            except Exception as e:
+                logger.error(f"Schedule snapshot listener failed for {key}: {e}")
+    
+    def is_dirty(self, kind: str, owner: str) -> bool:
+        snapshot = self._snapshots.get((kind, owner))
+        return snapshot is not None and snapshot.dirty
+    
+    def _drop(self, key: Tuple[str, str]) -> None:
+        snapshot = self._snapshots.pop(key, None)
+        if snapshot is None:
+            return
+        for session_id in snapshot.session_ids():
+            owners = self._session_owners.get(session_id)
+            if owners:
+                owners.discard(key)
+                if not owners:
+                    del self._session_owners[session_id]
+    
+    def invalidate(self, kind: str, owner: str) -> None:
+        """Mark an owner's snapshot stale so the next request reloads it"""
+        snapshot = self._snapshots.get((kind, owner))
+        if snapshot is not None and not snapshot.dirty:
+            snapshot.dirty = True
+            self.invalidated += 1
+    
+    def request_load(self, loader: Callable[[], Awaitable[Optional[ScheduleSnapshot]]],
+                     kind: str, owner: str) -> asyncio.Task:
+        """Load a snapshot in the background unless a load is already running"""
+        key = (kind, owner)
+        if key in self._loading:
+            return self._loading[key]
+        
+        async def load():
+            try:
+                for _ in range(2):
+                    generation = self._generations.get(key, 0)
+                    snapshot = await loader()
+                    if snapshot is None:
+                        return
+                    if self._generations.get(key, 0) == generation:
+                        break
+                else:
+                    # Still changing: keep it for degraded answers, the next request reloads it
+                    snapshot.dirty = True
+                self.store(kind, owner, snapshot)
+            except Exception as e:
+                logger.error(f"Failed to load schedule snapshot for {key}: {e}")
+            finally:
+                self._loading.pop(key, None)
+                self._generations.pop(key, None)
+        
+        self._loading[key] = asyncio.create_task(load())
+        return self._loading[key]
+    
+    def apply_notifications(self, notifications: List[dict]) -> Set[Tuple[str, str]]:
+        """Update snapshots from change notifications; returns owners whose schedule changed"""
+        changed: Set[Tuple[str, str]] = set()
+        applied = set()
+        for notification in notifications:
+            session = notification.get('session')
+            # One change is usually queued once per recipient; apply it once. The session id and
+            # times are all a change applies, so they identify it without serializing the session.
+            if isinstance(session, dict):
+                change_key = (notification.get('type'), str(session.get('_id')), session.get('startAt'),
+                              session.get('endAt'))
+            else:
+                change_key = (notification.get('type'), str(session), None, None)
+            if session and change_key in applied:
+                continue
+            applied.add(change_key)
+            payload = notification.get('payload') or {}
+            data = payload.get('data') or {}
+            if isinstance(session, dict):
+                session_id = str(session.get('_id'))
+                groups = session.get('groups') or []
+                teacher = session.get('teacher')
+            else:
+                session_id = str(session or data.get('sessionId') or '')
+                groups = []
+                teacher = None
+            groups = groups or (notification.get('recipients') or {}).get('groups') or []
+            if isinstance(teacher, dict):
+                teacher = teacher.get('_id')
+            
+            owners = set(self._session_owners.get(session_id, set()))
+            owners.update(('group', str(group)) for group in groups)
+            if teacher:
+                owners.add(('teacher', str(teacher)))
+            changed |= owners
+            
+            notification_type = notification.get('type')
+            if notification_type == 'session_cancelled':
+                # Snapshots without the session are unaffected; the rest are fixed in place
+                self._remove_session(session_id)
+                owners.clear()
+            elif (notification_type in ('time_changed', 'session_moved') and isinstance(session, dict)
+                  and session.get('startAt') and session.get('endAt') and self._only_moved(data.get('changes'))):
+                owners -= self._patch_times(session_id, session, teacher)
+            
+            for kind, owner in owners:
+                self.invalidate(kind, owner)
+        
+        for key in changed:
+            if key in self._loading:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            if key in self._snapshots and not self._snapshots[key].dirty:
+                self._notify(key)
+        return changed
+    
+    def _remove_session(self, session_id: str) -> None:
+        for key in self._session_owners.pop(session_id, set()):
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                snapshot.sessions = [session for session in snapshot.sessions if session.id != session_id]
+                self.patched += 1
+    
+    def _only_moved(self, changes) -> bool:
+        # The same update may also change room or teacher under a time_changed type; without
+        # the change set (older backends) it can't be patched safely
+        return isinstance(changes, dict) and set(changes) <= self.TIME_CHANGES
+    
+    def _patch_times(self, session_id: str, session: dict, teacher: Optional[str]) -> Set[Tuple[str, str]]:
+        """Move a known session in place; returns owners that no longer need a reload"""
+        patched = set()
+        start, end = parse_backend_time(session['startAt']), parse_backend_time(session['endAt'])
+        groups = {str(group) for group in session.get('groups') or ()}
+        for key in self._session_owners.get(session_id, set()):
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or not snapshot.window_start <= start.date() < snapshot.window_end:
+                continue
+            current = next((item for item in snapshot.sessions if item.id == session_id), None)
+            # Teacher, groups and type decide who sees the session and how; reload if any of them differ
+            if (current is None or set(current.groups) != groups
+                    or (current.teacher.id if current.teacher else None) != (str(teacher) if teacher else None)
+                    or session.get('type', current.type) != current.type):
+                continue
+            snapshot.sessions = sorted(
+                (session.moved(start, end) if session.id == session_id else session
+                 for session in snapshot.sessions),
+                key=lambda session: session.start
+            )
+            patched.add(key)
+            self.patched += 1
+        return patched
+    
+    async def close(self) -> None:
+        """Cancel running loads"""
+        tasks = list(self._loading.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loading.clear()
+    
+    def stats(self) -> dict:
+        """Snapshot statistics"""
+        return {
+            'owners': len(self._snapshots),
+            'hits': self.hits,
+            'misses': self.misses,
+            'patched': self.patched,
+            'invalidated': self.invalidated,
+        }
+
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase, unify ё/е and drop punctuation for matching"""
+    text = re.sub(r'[^\w\s]', '', text.lower().replace('ё', 'е'))
+    return ' '.join(text.split())
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class DirectoryIndex:
+    """In-memory prefix and trigram search over (id, label) entries"""
+    
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self.entries: List[Tuple[str, str]] = sorted(entries, key=lambda entry: normalize_search_text(entry[1]))
+        self._labels = dict(self.entries)
+        self._normalized = [normalize_search_text(label) for _, label in self.entries]
+        self._by_text = {text: i for i, text in enumerate(self._normalized)}
+        # Sorted (token, entry index) pairs for prefix lookups
+        self._tokens = sorted((token, i) for i, text in enumerate(self._normalized) for token in text.split())
+        self._trigrams: Dict[str, Set[int]] = {}
+        for i, text in enumerate(self._normalized):
+            for gram in trigrams(text):
+                self._trigrams.setdefault(gram, set()).add(i)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def label(self, entry_id: str) -> Optional[str]:
+        return self._labels.get(entry_id)
+    
+    def find(self, text: str) -> Optional[Tuple[str, str]]:
+        """Entry whose label equals text, ignoring case and punctuation"""
+        i = self._by_text.get(normalize_search_text(text))
+        return self.entries[i] if i is not None else None
+    
+    def _prefix_matches(self, query: str) -> Set[int]:
+        matches = set()
+        for token, i in self._tokens[bisect_left(self._tokens, (query, -1)):]:
+            if not token.startswith(query):
+                break
+            matches.add(i)
+        return matches
+    
+    def search(self, query: str) -> List[Tuple[str, str]]:
+        """Entries matching query: word prefixes first, then substrings, then close trigram matches"""
+        query = normalize_search_text(query)
+        if not query:
+            return self.entries
+        
+        prefix = self._prefix_matches(query.split()[0]) if ' ' not in query else set()
+        grams = trigrams(query)
+        if not grams:
+            return [self.entries[i] for i in sorted(prefix)]
+        
+        candidates = set.intersection(*(self._trigrams.get(gram, set()) for gram in grams))
+        substring = {i for i in candidates if query in self._normalized[i]}
+        ranked = sorted(prefix) + sorted(substring - prefix)
+        if ranked:
+            return [self.entries[i] for i in ranked]
+        
+        # Typos: entries sharing at least half of the query trigrams, best first
+        scores: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._trigrams.get(gram, ()):
+                scores[i] = scores.get(i, 0) + 1
+        threshold = max(2, len(grams) // 2)
+        close = sorted((-score, i) for i, score in scores.items() if score >= threshold)
+        return [self.entries[i] for _, i in close]
+
+
+class DirectoryCache:
+    """Backend directory (groups or teachers) refreshed by TTL with conditional requests"""
+    
+    def __init__(self, path: str, to_entries: Callable[[dict], Iterable[Tuple[str, str]]], ttl: int):
+        self.path = path
+        self.to_entries = to_entries
+        self.ttl = ttl
+        self.index: Optional[DirectoryIndex] = None
+        self.etag: Optional[str] = None
+        self.loaded_at = 0.0
+        self.refreshes = 0
+        self.not_modified = 0
+        self._lock = asyncio.Lock()
+    
+    def _fresh(self) -> bool:
+        return self.index is not None and time.monotonic() - self.loaded_at < self.ttl
+    
+    async def get(self, api: 'ScheduleAPI') -> Optional[DirectoryIndex]:
+        """Current index, revalidated with backend when the TTL has passed"""
+        if self._fresh():
+            return self.index
+        
+        async with self._lock:
+            if self._fresh():
+                return self.index
+            try:
+                status, data, etag = await api.get_json_conditional(self.path, self.etag if self.index else None)
+                if status == 304:
+                    self.not_modified += 1
+                    self.loaded_at = time.monotonic()
+                elif status == 200 and data.get('success'):
+                    self.index = DirectoryIndex(self.to_entries(data))
+                    self.etag = etag
+                    self.refreshes += 1
+                    self.loaded_at = time.monotonic()
+                else:
+                    logger.error(f"Failed to refresh directory {self.path}: {status}")
+            except Exception as e:
+                # Keep serving the previous index if there is one
+                logger.error(f"Failed to refresh directory {self.path}: {e}")
+        return self.index
+
+
+def expand_broadcasts(broadcasts: List[dict]) -> List[dict]:
+    """Per-chat notifications from grouped ones; the message text is shared, not copied"""
+    notifications = []
+    for broadcast in broadcasts:
+        payload = broadcast.get('payload') or {}
+        data = payload.get('data') or {}
+        for chat in broadcast.get('chats', []):
+            notifications.append({
+                '_id': chat['_id'],
+                'type': broadcast.get('type'),
+                'session': broadcast.get('session'),
+                'recipients': broadcast.get('recipients'),
+                'payload': {**payload, 'data': {**data, 'chatId': chat.get('chatId')}},
+            })
+    return notifications
+
+
+class ConnectionPoolStats:
+    """Connection pool usage statistics collected through aiohttp tracing"""
+    
+    def __init__(self):
+        self.requests_started = 0
+        self.requests_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self.pool_wait_time = 0.0
+        self.pool_wait_max = 0.0
+        self.request_time = 0.0
+    
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Build a TraceConfig that feeds this object"""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_end)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        return trace_config
+    
+    async def _on_request_start(self, session, ctx, params):
+        ctx.request_start = time.monotonic()
+        self.requests_started += 1
+        self.requests_in_flight += 1
+    
+    async def _on_request_end(self, session, ctx, params):
+        self.requests_in_flight -= 1
+        self.request_time += time.monotonic() - ctx.request_start
+    
+    async def _on_queued_start(self, session, ctx, params):
+        ctx.queued_start = time.monotonic()
+        self.pool_waits += 1
+    
+    async def _on_queued_end(self, session, ctx, params):
+        waited = time.monotonic() - ctx.queued_start
+        self.pool_wait_time += waited
+        self.pool_wait_max = max(self.pool_wait_max, waited)
+    
+    async def _on_connection_create_end(self, session, ctx, params):
+        self.connections_created += 1
+    
+    async def _on_connection_reuseconn(self, session, ctx, params):
+        self.connections_reused += 1
+    
+    def snapshot(self) -> dict:
+        """Current statistics; pool wait vs request time shows where handlers are blocked"""
+        completed = self.requests_started - self.requests_in_flight
+        return {
+            'requests_started': self.requests_started,
+            'requests_in_flight': self.requests_in_flight,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'pool_waits': self.pool_waits,
+            'pool_wait_avg': self.pool_wait_time / self.pool_waits if self.pool_waits else 0.0,
+            'pool_wait_max': self.pool_wait_max,
+            'request_time_avg': self.request_time / completed if completed else 0.0,
+        }
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    """Prometheus label set, e.g. {method="get_schedule"}; empty string without labels"""
+    text = ','.join(f'{name}="{value}"' for name, value in pairs)
+    return f"{{{text}}}" if text else ''
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets; observing is a bisect and two additions"""
+    
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            pairs = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = '+Inf' if bound is None else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(pairs)} {total}")
+            lines.append(f"{self.name}_count{format_labels(pairs)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms recorded on the hot path plus collectors read only when /metrics is scraped"""
+    
+    def __init__(self):
+        self._histograms: List[Histogram] = []
+        # Each collector yields (name, type, help, labels, value)
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, dict, float]]]] = []
+    
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, help_text, labelnames, buckets)
+        self._histograms.append(histogram)
+        return histogram
+    
+    def add_collector(self, collect: Callable[[], Iterable[Tuple[str, str, str, dict, float]]]) -> None:
+        self._collectors.append(collect)
+    
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        # Samples of one metric must be adjacent in the output
+        families: Dict[str, List[str]] = {}
+        for collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, metric_type, help_text, labels, value in samples:
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+                family.append(f"{name}{format_labels(labels.items())} {value}")
+        for family in families.values():
+            lines.extend(family)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+backend_latency = metrics.histogram(
+    'schedule_bot_backend_call_seconds', 'Latency of ScheduleAPI methods', ('method',)
+)
+schedule_reply_latency = metrics.histogram(
+    'schedule_bot_schedule_reply_seconds', 'Time from a schedule request to the reply', ('source',)
+)
+telegram_send_latency = metrics.histogram(
+    'schedule_bot_telegram_send_seconds', 'Telegram sendMessage latency', ('result',)
+)
+dispatch_batch_latency = metrics.histogram(
+    'schedule_bot_dispatch_batch_seconds', 'Time to deliver one batch of notifications',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+backend_decode_latency = metrics.histogram(
+    'schedule_bot_backend_decode_seconds', 'CPU time to decode a backend JSON response', ('codec',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+)
+
+
+def timed(histogram: Histogram):
+    """Record the duration of an async method in a histogram labelled with the method name"""
+    def decorate(func):
+        name = func.__name__
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorate
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics"""
+    
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics endpoint listening on {self.host}:{self.port}/metrics")
+    
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+    
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+
+class BackendUnavailable(Exception):
+    """Backend call refused without trying: circuit open or too many calls in flight"""
+
+
+class BackendCircuitBreaker:
+    """Circuit breaker and concurrency limit shared by all backend calls"""
+    
+    def __init__(self, threshold: int, reset_timeout: float, max_inflight: int, queue_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.queue_timeout = queue_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._slots = asyncio.Semaphore(max_inflight)
+        self.in_flight = 0
+        self.rejected = 0
+        self.opened = 0
+    
+    @property
+    def available(self) -> bool:
+        """False while calls are failed fast (open, or half-open with a probe running)"""
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+        return not self._probing
+    
+    async def acquire(self) -> bool:
+        """Take a call slot or raise BackendUnavailable; returns whether the call is the half-open probe"""
+        if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = 'half_open'
+        if self.state == 'open' or (self.state == 'half_open' and self._probing):
+            self.rejected += 1
+            raise BackendUnavailable(f"circuit {self.state}")
+        probe = self.state == 'half_open'
+        if probe:
+            # This call is the probe; everyone else fails fast until it finishes
+            self._probing = True
+        
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if probe:
+                self._probing = False
+            self.rejected += 1
+            raise BackendUnavailable("too many backend calls in flight")
+        except BaseException:
+            if probe:
+                self._probing = False
+            raise
+        self.in_flight += 1
+        return probe
+    
+    def release(self, ok: Optional[bool], probe: bool) -> None:
+        """Return a call slot; ok is None when the call was cancelled and says nothing about backend"""
+        self.in_flight -= 1
+        self._slots.release()
+        if probe:
+            self._probing = False
+        elif self.state != 'closed':
+            # Started before the circuit opened: only the probe decides when it closes again
+            return
+        if ok:
+            if self.state != 'closed':
+                logger.info("Backend recovered, closing circuit")
+            self.state = 'closed'
+            self._failures = 0
+        elif ok is False:
+            self._failures += 1
+            if probe or self._failures >= self.threshold:
+                if self.state != 'open':
+                    self.opened += 1
+                    logger.warning(f"Backend failing ({self._failures} errors in a row), opening circuit "
+                                   f"for {self.reset_timeout:.0f}s")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+    
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'opened': self.opened,
+        }
 
 
 class ScheduleAPI:
@@ -57,30 +1561,234 @@ class ScheduleAPI:
     def __init__(self, base_url: str):
         self.base_url = base_url
         self.session: Optional[aiohttp.ClientSession] = None
+        self.schedule_cache = ScheduleCache(SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_TTL, SCHEDULE_CACHE_STALE_TTL)
+        self.snapshots = ScheduleSnapshotStore(SCHEDULE_SNAPSHOT_TTL, SCHEDULE_SNAPSHOT_MAX_OWNERS)
+        self.groups_directory = DirectoryCache(
+            '/api/schedule/groups', lambda data: ((group, group) for group in data.get('groups', [])), DIRECTORY_TTL
+        )
+        self.teachers_directory = DirectoryCache(
+            '/api/schedule/teachers',
+            lambda data: ((teacher['_id'], teacher['name']) for teacher in data.get('teachers', [])),
+            DIRECTORY_TTL
+        )
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.coalesced_requests = 0
+        self.degraded_responses = 0
+        self.pool_stats = ConnectionPoolStats()
+        self.breaker = BackendCircuitBreaker(
+            BACKEND_BREAKER_THRESHOLD, BACKEND_BREAKER_RESET, BACKEND_MAX_INFLIGHT, BACKEND_QUEUE_TIMEOUT
+        )
     
     async def ensure_session(self):
         """Ensure aiohttp session exists"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=BACKEND_POOL_LIMIT,
+                limit_per_host=BACKEND_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=BACKEND_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=BACKEND_DNS_TTL,
+                use_dns_cache=True,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=BACKEND_TOTAL_TIMEOUT,
+                connect=BACKEND_CONNECT_TIMEOUT,
+                sock_read=BACKEND_READ_TIMEOUT,
+            )
+            headers = {'Accept-Encoding': 'gzip, deflate' if BACKEND_HTTP_COMPRESSION else 'identity'}
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers=headers,
+                json_serialize=json_dumps,
+                trace_configs=[self.pool_stats.trace_config()],
+            )
+    
+    async def _get_json(self, url: str, params: Optional[dict] = None) -> Tuple[int, Optional[dict]]:
+        """GET a URL and return (status, json); concurrent identical calls share one request"""
+        key = ('GET', url, tuple(sorted((params or {}).items())))
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._do_get_json(url, params))
+            self._inflight[key] = future
+            
+            def release(done: asyncio.Future) -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+            
+            future.add_done_callback(release)
+        else:
+            self.coalesced_requests += 1
+        
+        # Shield so that one cancelled caller does not cancel the request for the others
+        return await asyncio.shield(future)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> Tuple[int, Optional[dict], Optional[str]]:
+        """Backend call through the circuit breaker; returns (status, json on 200, etag)"""
+        await self.ensure_session()
+        probe = await self.breaker.acquire()
+        ok = False
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                data = None
+                if response.status == 200:
+                    body = await response.read()
+                    started = time.perf_counter()
+                    data = json_loads(body)
+                    backend_decode_latency.observe(time.perf_counter() - started, JSON_CODEC)
+                ok = response.status < 500
+                return response.status, data, response.headers.get('ETag')
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        finally:
+            self.breaker.release(ok, probe)
+    
+    async def _do_get_json(self, url: str, params: Optional[dict] = None) -> Tuple[int, Optional[dict]]:
+        status, data, _ = await self._request('GET', url, params=params)
+        return status, data
+    
+    async def get_json_conditional(self, path: str, etag: Optional[str] = None) -> Tuple[int, Optional[dict], Optional[str]]:
+        """GET with If-None-Match; returns (status, json, etag)"""
+        headers = {'If-None-Match': etag} if etag else None
+        return await self._request('GET', f"{self.base_url}{path}", headers=headers)
     
     async def close(self):
         """Close the session"""
+        await self.snapshots.close()
+        await self.schedule_cache.close()
         if self.session and not self.session.closed:
             await self.session.close()
     
+    @timed(backend_latency)
     async def get_schedule(self, group: str, period: str = 'today', subgroup: str = 'all') -> dict:
-        """Get schedule for a group"""
-        await self.ensure_session()
+        """Get schedule for a group (from local snapshot or cache when possible)"""
+        local = self.snapshots.lookup('group', group, period, subgroup)
+        if local is not None:
+            return local
+        if self.breaker.available:
+            # Failing loads would only add an error per request while backend is down
+            self.snapshots.request_load(self._snapshot_loader('group', group), 'group', group)
+        
+        key = ScheduleCache.make_key('group', group, period, subgroup)
+        result = await self.schedule_cache.get_or_fetch(
+            key, lambda: self._fetch_schedule(group, period, subgroup)
+        )
+        return result if result.get('success') else self.degraded_schedule('group', group, period, subgroup) or result
+    
+    @timed(backend_latency)
+    async def get_teacher_schedule(self, teacher_id: str, period: str = 'today') -> dict:
+        """Get schedule for a teacher (from local snapshot or cache when possible)"""
+        local = self.snapshots.lookup('teacher', teacher_id, period)
+        if local is not None:
+            return local
+        if self.breaker.available:
+            # Failing loads would only add an error per request while backend is down
+            self.snapshots.request_load(self._snapshot_loader('teacher', teacher_id), 'teacher', teacher_id)
+        
+        key = ScheduleCache.make_key('teacher', teacher_id, period)
+        result = await self.schedule_cache.get_or_fetch(
+            key, lambda: self._fetch_teacher_schedule(teacher_id, period)
+        )
+        return result if result.get('success') else self.degraded_schedule('teacher', teacher_id, period) or result
+    
+    def degraded_schedule(self, kind: str, owner: str, period: str, subgroup: str = 'all') -> Optional[dict]:
+        """Last good schedule however old, marked 'degraded', for when backend can't answer"""
+        data = self.snapshots.lookup(kind, owner, period, subgroup, count_miss=False, allow_stale=True)
+        if data is not None:
+            age = self.snapshots.age(kind, owner)
+        else:
+            key, _ = self._schedule_fetcher(kind, owner, period, subgroup)
+            data, age = self.schedule_cache.last_good(key)
+            if data is None:
+                return None
+        self.degraded_responses += 1
+        return dict(data, degraded=True, age=age)
+    
+    def _schedule_fetcher(self, kind: str, owner: str, period: str,
+                          subgroup: str) -> Tuple[Tuple, Callable[[], Awaitable[dict]]]:
+        if kind == 'teacher':
+            return (ScheduleCache.make_key('teacher', owner, period),
+                    lambda: self._fetch_teacher_schedule(owner, period))
+        return (ScheduleCache.make_key('group', owner, period, subgroup),
+                lambda: self._fetch_schedule(owner, period, subgroup))
+    
+    def peek_schedule(self, kind: str, owner: str, period: str, subgroup: str = 'all',
+                      count_hit: bool = True) -> Tuple[Optional[dict], bool, float]:
+        """Locally available schedule as (data, is_fresh, age in seconds), without network calls"""
+        local = self.snapshots.lookup(kind, owner, period, subgroup, count_miss=False)
+        if local is not None:
+            # Snapshots are kept current by change notifications
+            return local, True, 0.0
+        key, _ = self._schedule_fetcher(kind, owner, period, subgroup)
+        return self.schedule_cache.peek(key, count_hit)
+    
+    @timed(backend_latency)
+    async def refresh_schedule(self, kind: str, owner: str, period: str, subgroup: str = 'all') -> dict:
+        """Fetch a schedule from backend, bypassing cached data"""
+        key, fetch = self._schedule_fetcher(kind, owner, period, subgroup)
+        return await self.schedule_cache.refresh(key, fetch) or {'success': False}
+    
+    def _snapshot_loader(self, kind: str, owner: str) -> Callable[[], Awaitable[Optional[ScheduleSnapshot]]]:
+        if kind == 'teacher':
+            return lambda: self._load_teacher_snapshot(owner)
+        return lambda: self._load_group_snapshot(owner)
+    
+    @timed(backend_latency)
+    async def warm_snapshot(self, kind: str, owner: str) -> None:
+        """Load a group/teacher snapshot and wait for it"""
+        await asyncio.shield(self.snapshots.request_load(self._snapshot_loader(kind, owner), kind, owner))
+    
+    def apply_schedule_changes(self, notifications: List[dict]) -> None:
+        """Update local snapshots and drop cached responses affected by change notifications"""
+        changed = self.snapshots.apply_notifications(notifications)
+        if changed:
+            # GETs started before the change must not answer requests made after it
+            self._inflight.clear()
+        for kind, owner in changed:
+            self.schedule_cache.invalidate(kind, owner)
+            if self.snapshots.is_dirty(kind, owner):
+                self.snapshots.request_load(self._snapshot_loader(kind, owner), kind, owner)
+    
+    async def _load_group_snapshot(self, group: str) -> Optional[ScheduleSnapshot]:
+        """Load this week and tomorrow for a group in one range request"""
+        dates = schedule_dates()
+        window_start = dates['week_start']
+        window_end = max(dates['week_end'], dates['tomorrow'] + timedelta(days=1))
+        start = datetime.combine(window_start, datetime.min.time(), LOCAL_TZ)
+        end = datetime.combine(window_end, datetime.min.time(), LOCAL_TZ)
+        
+        url = f"{self.base_url}/api/schedule/group/{group}/range"
+        params = {'startDate': start.isoformat(), 'endDate': end.isoformat()}
+        status, data = await self._get_json(url, params)
+        if status != 200 or not data.get('success'):
+            logger.error(f"Failed to load schedule snapshot for group {group}: {status}")
+            return None
+        return ScheduleSnapshot(parse_sessions(data.get('sessions', [])), window_start, window_end)
+    
+    async def _load_teacher_snapshot(self, teacher_id: str) -> Optional[ScheduleSnapshot]:
+        """Load the current week of a teacher"""
+        dates = schedule_dates()
+        url = f"{self.base_url}/api/schedule/teacher/{teacher_id}/week"
+        status, data = await self._get_json(url)
+        if status != 200 or not data.get('success'):
+            logger.error(f"Failed to load schedule snapshot for teacher {teacher_id}: {status}")
+            return None
+        return ScheduleSnapshot(parse_schedule(data)['sessions'], dates['week_start'], dates['week_end'])
+    
+    async def _fetch_schedule(self, group: str, period: str = 'today', subgroup: str = 'all') -> dict:
+        """Fetch schedule for a group from backend"""
         try:
             url = f"{self.base_url}/api/schedule/group/{group}/{period}"
             params = {'subgroup': subgroup} if subgroup != 'all' else {}
             
-            async with self.session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    logger.error(f"API error: {response.status}")
-                    return {'success': False, 'sessions': []}
+            status, data = await self._get_json(url, params)
+            if status == 200:
+                return parse_schedule(data)
+            else:
+                logger.error(f"API error: {status}")
+                return {'success': False, 'sessions': []}
+        except BackendUnavailable:
+            return {'success': False, 'sessions': []}
         except asyncio.TimeoutError:
             logger.error("API timeout")
             return {'success': False, 'sessions': []}
@@ -88,118 +1796,128 @@ class ScheduleAPI:
             logger.error(f"API error: {e}")
             return {'success': False, 'sessions': []}
     
-    async def get_teacher_schedule(self, teacher_id: str, period: str = 'today') -> dict:
-        """Get schedule for a teacher"""
-        await self.ensure_session()
+    async def _fetch_teacher_schedule(self, teacher_id: str, period: str = 'today') -> dict:
+        """Fetch schedule for a teacher from backend"""
         try:
             url = f"{self.base_url}/api/schedule/teacher/{teacher_id}/{period}"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    return await response.json()
-                return {'success': False, 'sessions': []}
+            status, data = await self._get_json(url)
+            if status == 200:
+                return parse_schedule(data)
+            return {'success': False, 'sessions': []}
+        except BackendUnavailable:
+            return {'success': False, 'sessions': []}
         except Exception as e:
             logger.error(f"API error: {e}")
             return {'success': False, 'sessions': []}
     
+    @timed(backend_latency)
     async def get_teachers(self) -> List[dict]:
         """Get list of all teachers"""
-        await self.ensure_session()
-        try:
-            url = f"{self.base_url}/api/schedule/teachers"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('teachers', [])
-                return []
-        except Exception as e:
-            logger.error(f"API error: {e}")
+        directory = await self.teachers_directory.get(self)
+        if directory is None:
             return []
+        return [{'_id': teacher_id, 'name': name} for teacher_id, name in directory.entries]
     
+    @timed(backend_latency)
     async def get_groups(self) -> List[str]:
         """Get list of all groups"""
-        await self.ensure_session()
-        try:
-            url = f"{self.base_url}/api/schedule/groups"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('groups', [])
-                return []
-        except Exception as e:
-            logger.error(f"API error: {e}")
+        directory = await self.groups_directory.get(self)
+        if directory is None:
             return []
+        return [group for group, _ in directory.entries]
     
+    @timed(backend_latency)
     async def register_telegram_user(self, user_data: dict) -> bool:
         """Register telegram user on backend"""
-        await self.ensure_session()
         try:
             url = f"{self.base_url}/api/webhooks/telegram/register"
-            async with self.session.post(url, json=user_data, timeout=10) as response:
-                if response.status == 200:
-                    logger.info(f"Successfully registered telegram user {user_data.get('telegramId')}")
-                    return True
-                else:
-                    logger.error(f"Failed to register: {response.status}")
-                    return False
+            status, _, _ = await self._request('POST', url, json=user_data)
+            if status == 200:
+                logger.info(f"Successfully registered telegram user {user_data.get('telegramId')}")
+                return True
+            else:
+                logger.error(f"Failed to register: {status}")
+                return False
         except Exception as e:
             logger.error(f"Registration API error: {e}")
             return False
     
     async def get_pending_notifications(self, limit: int = 50) -> List[dict]:
         """Get pending notifications from backend"""
-        await self.ensure_session()
+        notifications, _ = await self.get_pending_notifications_page(limit)
+        return notifications
+    
+    @timed(backend_latency)
+    async def get_pending_notifications_page(self, limit: int = 50) -> Tuple[List[dict], Optional[int]]:
+        """Get pending notifications and the total number still pending on backend"""
         try:
             url = f"{self.base_url}/api/webhooks/telegram/pending-notifications"
-            params = {'limit': limit}
+            params = {
+                'limit': limit,
+                'grouped': 'true',
+                'workerId': NOTIFICATION_WORKER_ID,
+                'leaseSeconds': NOTIFICATION_LEASE_SECONDS,
+            }
             headers = {'x-api-key': WEBHOOK_API_KEY} if WEBHOOK_API_KEY else {}
-            async with self.session.get(url, params=params, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('notifications', [])
+            started = time.monotonic()
+            status, data, _ = await self._request('GET', url, params=params, headers=headers)
+            if status == 200:
+                if 'broadcasts' in data:
+                    notifications = expand_broadcasts(data['broadcasts'])
                 else:
-                    logger.error(f"Failed to fetch notifications: {response.status}")
-                    return []
+                    notifications = data.get('notifications', [])
+                if data.get('lease'):
+                    # Stop sending a little before the backend may hand the batch to another worker
+                    deadline = started + NOTIFICATION_LEASE_SECONDS * 0.9
+                    for notification in notifications:
+                        notification['leaseDeadline'] = deadline
+                return notifications, data.get('pending')
+            else:
+                logger.error(f"Failed to fetch notifications: {status}")
+                return [], None
+        except BackendUnavailable as e:
+            logger.warning(f"Skipping notification poll, backend unavailable: {e}")
+            return [], None
         except Exception as e:
             logger.error(f"Error fetching notifications: {e}")
-            return []
+            return [], None
     
+    @timed(backend_latency)
     async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[dict]:
         """Get user data by telegram ID"""
-        await self.ensure_session()
         try:
             url = f"{self.base_url}/api/webhooks/telegram/user/{telegram_id}"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get('user') if data.get('success') else None
-                elif response.status == 404:
-                    return None
-                else:
-                    logger.error(f"Failed to fetch user: {response.status}")
-                    return None
+            status, data = await self._get_json(url)
+            if status == 200:
+                return data.get('user') if data.get('success') else None
+            elif status == 404:
+                return None
+            else:
+                logger.error(f"Failed to fetch user: {status}")
+                return None
         except Exception as e:
             logger.error(f"Error fetching user: {e}")
             return None
     
+    @timed(backend_latency)
     async def delete_user_by_telegram_id(self, telegram_id: str) -> bool:
         """Delete user data by telegram ID"""
-        await self.ensure_session()
         try:
             url = f"{self.base_url}/api/webhooks/telegram/user/{telegram_id}"
-            async with self.session.delete(url, timeout=10) as response:
-                if response.status == 200:
-                    logger.info(f"Deleted user {telegram_id} from backend")
-                    return True
-                else:
-                    logger.error(f"Failed to delete user: {response.status}")
-                    return False
+            status, _, _ = await self._request('DELETE', url)
+            if status == 200:
+                logger.info(f"Deleted user {telegram_id} from backend")
+                return True
+            else:
+                logger.error(f"Failed to delete user: {status}")
+                return False
         except Exception as e:
             logger.error(f"Error deleting user: {e}")
             return False
     
+    @timed(backend_latency)
     async def update_notification_status(self, notification_id: str, status: str, error: str = None) -> bool:
         """Update notification delivery status"""
-        await self.ensure_session()
         try:
             url = f"{self.base_url}/api/webhooks/telegram/notification-status"
             payload = {
@@ -210,58 +1928,204 @@ class ScheduleAPI:
                 payload['error'] = error
             
             headers = {'x-api-key': WEBHOOK_API_KEY} if WEBHOOK_API_KEY else {}
-            async with self.session.post(url, json=payload, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    logger.info(f"Updated notification {notification_id} status to {status}")
-                    return True
-                else:
-                    logger.error(f"Failed to update notification status: {response.status}")
-                    return False
+            response_status, _, _ = await self._request('POST', url, json=payload, headers=headers)
+            if response_status == 200:
+                logger.info(f"Updated notification {notification_id} status to {status}")
+                return True
+            else:
+                logger.error(f"Failed to update notification status: {response_status}")
+                return False
         except Exception as e:
             logger.error(f"Error updating notification status: {e}")
             return False
+    
+    @timed(backend_latency)
+    async def update_notification_statuses(self, updates: List[dict]) -> bool:
+        """Update delivery status of many notifications in one request"""
+        try:
+            url = f"{self.base_url}/api/webhooks/telegram/notification-status/bulk"
+            headers = {'x-api-key': WEBHOOK_API_KEY} if WEBHOOK_API_KEY else {}
+            status, data, _ = await self._request('POST', url, json={'updates': updates}, headers=headers)
+            if status == 200:
+                if data.get('rejected'):
+                    logger.warning(f"Backend rejected status updates for: {data['rejected']}")
+                logger.info(f"Updated status of {len(updates)} notifications")
+                return True
+            else:
+                logger.error(f"Failed to update notification statuses: {status}")
+                return False
+        except Exception as e:
+            logger.error(f"Error updating notification statuses: {e}")
+            return False
 
 
 # Initialize API client
 api = ScheduleAPI(BACKEND_URL)
 
 
-def format_session(session: dict) -> str:
+def schedule_sessions(schedule_data: dict) -> List[Session]:
+    """Sessions of a parsed schedule response, in start order"""
+    return schedule_data.get('sessions', [])
+
+
+SESSION_TYPE_EMOJI = {
+    'lecture': '📚',
+    'seminar': '💬',
+    'lab': '🔬',
+    'practice': '✏️',
+    'exam': '📝',
+    'test': '📋'
+}
+
+DAY_NAMES = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+class RenderCache:
+    """Bounded LRU cache of rendered message text"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[tuple, Tuple[tuple, str]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: tuple, fingerprint: tuple = ()) -> Optional[str]:
+        """Rendered text for key if it was rendered from the same data"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+    
+    def set(self, key: tuple, text: str, fingerprint: tuple = ()) -> None:
+        self._entries[key] = (fingerprint, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+session_fragments = RenderCache(RENDER_CACHE_SIZE)
+rendered_messages = RenderCache(RENDER_CACHE_SIZE)
+
+
+def schedule_fingerprint(sessions: List[Session]) -> tuple:
+    return tuple(session.version for session in sessions)
+
+
+def format_session(session: Session) -> str:
     """Format a session for display"""
-    # Convert UTC to local time (Asia/Yekaterinburg UTC+5)
-    start_time = datetime.fromisoformat(session['startAt'].replace('Z', '+00:00'))
-    end_time = datetime.fromisoformat(session['endAt'].replace('Z', '+00:00'))
-    
-    # Add 5 hours for Yekaterinburg timezone
-    start_time = start_time + timedelta(hours=5)
-    end_time = end_time + timedelta(hours=5)
-    
-    course_name = session.get('course', {}).get('name', 'N/A')
-    teacher = session.get('teacher')
-    teacher_name = teacher.get('name', 'N/A') if teacher else 'Преподаватель не назначен'
-    room_info = session.get('room', {})
-    room_str = f"{room_info.get('building', '')} {room_info.get('number', 'N/A')}"
-    
-    # Get pair number if available
-    pair_number = session.get('pairNumber')
-    pair_str = f"{pair_number} пара" if pair_number else "Занятие"
-    
-    session_type = session.get('type', 'lecture')
-    type_emoji = {
-        'lecture': '📚',
-        'seminar': '💬',
-        'lab': '🔬',
-        'practice': '✏️',
-        'exam': '📝',
-        'test': '📋'
-    }.get(session_type, '📖')
-    
-    return (
+    key = session.version
+    cacheable = session.id is not None
+    if cacheable:
+        cached = session_fragments.get(key)
+        if cached is not None:
+            return cached
+    
+    course_name = session.course.name if session.course else 'N/A'
+    teacher_name = session.teacher.name if session.teacher else 'Преподаватель не назначен'
+    pair_str = f"{session.pair_number} пара" if session.pair_number else "Занятие"
+    type_emoji = SESSION_TYPE_EMOJI.get(session.type, '📖')
+    
+    text = (
         f"{type_emoji} <b>{course_name}</b>\n"
-        f"🔢 {pair_str} ({start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')})\n"
+        f"🔢 {pair_str} ({session.start:%H:%M} - {session.end:%H:%M})\n"
         f"👤 {teacher_name}\n"
-        f"🏛 {room_str.strip()}\n"
+        f"🏛 {session.room}\n"
     )
+    if cacheable:
+        session_fragments.set(key, text)
+    return text
+
+
+def week_days(sessions: List[Session]) -> List[Tuple[date, List[Session]]]:
+    """Week sessions grouped by local date, in date order"""
+    return [(day, list(day_sessions)) for day, day_sessions in itertools.groupby(sessions, key=lambda s: s.day)]
+
+
+def schedule_header(kind: str, owner: str, subgroup: str, period: str) -> str:
+    if kind == 'teacher':
+        if period == 'week':
+            return "📆 <b>Ваше расписание на неделю</b>\n\n"
+        period_name = {'today': 'Сегодня', 'tomorrow': 'Завтра'}.get(period, period).lower()
+        return f"📅 <b>Ваше расписание на {period_name}</b>\n\n"
+    
+    group_line = f"Группа: {owner}" + (f" (подгруппа {subgroup})" if subgroup != 'all' else '') + "\n\n"
+    if period == 'week':
+        return "📆 <b>Расписание на неделю</b>\n" + group_line
+    period_name = {'today': 'Сегодня', 'tomorrow': 'Завтра'}.get(period, period).lower()
+    return f"📅 <b>Расписание на {period_name}</b>\n" + group_line
+
+
+def render_schedule(kind: str, owner: str, subgroup: str, period: str, sessions: List[Session]) -> str:
+    """Render a non-empty day schedule message (cached by owner, period and date)"""
+    key = (kind, owner, subgroup, period, schedule_dates()['today'])
+    fingerprint = schedule_fingerprint(sessions)
+    cached = rendered_messages.get(key, fingerprint)
+    if cached is not None:
+        return cached
+    
+    parts = [schedule_header(kind, owner, subgroup, period)]
+    for i, session in enumerate(sessions, 1):
+        parts.append(f"<b>{i}.</b> ")
+        parts.append(format_session(session))
+        if kind == 'teacher':
+            parts.append(f"Группы: {', '.join(session.groups)}\n\n")
+    
+    message = ''.join(parts)
+    rendered_messages.set(key, message, fingerprint)
+    return message
+
+
+def day_label(day: date) -> str:
+    return f"{DAY_NAMES[day.weekday()]}, {day:%d.%m}"
+
+
+def render_week_page(kind: str, owner: str, subgroup: str, sessions: List[Session],
+                     day: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Render one day of the week view with navigation buttons"""
+    days = week_days(sessions)
+    dates = [day_date for day_date, _ in days]
+    today = schedule_dates()['today']
+    try:
+        target = date.fromisoformat(day) if day else today
+    except ValueError:
+        target = today
+    # Requested day, or the nearest following day with classes
+    index = next((i for i, day_date in enumerate(dates) if day_date >= target), len(dates) - 1)
+    day_date, day_sessions = days[index]
+    
+    key = (kind, owner, subgroup, 'week', today, day_date)
+    fingerprint = schedule_fingerprint(day_sessions)
+    message = rendered_messages.get(key, fingerprint)
+    if message is None:
+        parts = [schedule_header(kind, owner, subgroup, 'week'), f"<b>{day_label(day_date)}:</b>\n"]
+        for session in day_sessions:
+            parts.append(format_session(session))
+            if kind == 'teacher':
+                parts.append(f"Группы: {', '.join(session.groups)}\n\n")
+        parts.append(f"\n<i>День {index + 1} из {len(days)}</i>")
+        message = ''.join(parts)
+        rendered_messages.set(key, message, fingerprint)
+    
+    buttons = []
+    if index > 0:
+        buttons.append(InlineKeyboardButton(f"◀ {day_label(dates[index - 1])}",
+                                            callback_data=f"week:{dates[index - 1].isoformat()}"))
+    if index < len(dates) - 1:
+        buttons.append(InlineKeyboardButton(f"{day_label(dates[index + 1])} ▶",
+                                            callback_data=f"week:{dates[index + 1].isoformat()}"))
+    return message, InlineKeyboardMarkup([buttons]) if buttons else None
 
 
 def get_student_keyboard() -> ReplyKeyboardMarkup:
@@ -298,7 +2162,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         if user_data:
             # Restore user data from backend
             role = user_data.get('role', 'guest')
-            user_data_store[user_id] = {
+            restored = {
                 'role': role,
                 'name': user_data.get('name'),
                 'telegram_id': user_id,
@@ -308,12 +2172,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             }
             
             if role == 'student':
-                user_data_store[user_id]['group'] = user_data.get('groupNumber')
-                user_data_store[user_id]['subgroup'] = 'all'  # Default
+                restored['group'] = user_data.get('groupNumber')
+                restored['subgroup'] = 'all'  # Default
             elif role == 'teacher':
                 # For teachers, we need to find their ID from the name
                 # This is a limitation - we should store teacher_id in User model
-                user_data_store[user_id]['teacher_id'] = None
+                restored['teacher_id'] = None
+            
+            user_data_store[user_id] = restored
             
             # Update chatId in backend if changed
             if user_data.get('telegramChatId') != str(chat_id):
@@ -379,8 +2245,7 @@ async def choose_role(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data['role'] = role
     
     if role == 'student':
-        # Get available groups
-        groups = await api.get_groups()
+        groups = await api.groups_directory.get(api)
         
         if not groups:
             await query.edit_message_text(
@@ -389,54 +2254,77 @@ async def choose_role(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
             )
             return ConversationHandler.END
         
-        # Create keyboard with groups
-        keyboard = []
-        for i in range(0, len(groups), 2):
-            row = groups[i:i+2]
-            keyboard.append(row)
-        keyboard.append(['❌ Отмена'])
-        
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-        
         await query.edit_message_text("Вы выбрали: Студент")
-        await query.message.reply_text(
-            "Выберите вашу группу:",
-            reply_markup=reply_markup
-        )
-        
-        context.user_data['available_groups'] = groups
+        if len(groups) <= DIRECTORY_PAGE_SIZE:
+            prompt = "Выберите вашу группу:"
+        else:
+            prompt = "Введите номер вашей группы (можно часть) или выберите из списка:"
+        await query.message.reply_text(prompt, reply_markup=get_group_keyboard(groups.entries))
         return STUDENT_GROUP
     
     else:  # teacher
         loading_msg = await query.edit_message_text("⏳ Загружаю список преподавателей...")
         
-        teachers = await api.get_teachers()
+        teachers = await api.teachers_directory.get(api)
         
         if not teachers:
             await loading_msg.edit_text("❌ Не удалось загрузить список преподавателей.")
             return ConversationHandler.END
         
-        # Create inline keyboard with teachers
-        keyboard = []
-        for teacher in teachers:
-            keyboard.append([InlineKeyboardButton(
-                teacher['name'],
-                callback_data=f"teacher_select_{teacher['_id']}"
-            )])
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await loading_msg.edit_text(
-            "Вы выбрали: Преподаватель\n\n"
-            "Выберите себя из списка:",
-            reply_markup=reply_markup
-        )
-        
-        context.user_data['teachers'] = {t['_id']: t['name'] for t in teachers}
+        context.user_data['teacher_query'] = ''
+        text, reply_markup = teacher_search_view(teachers, '', 0)
+        await loading_msg.edit_text(f"Вы выбрали: Преподаватель\n\n{text}", reply_markup=reply_markup)
         return TEACHER_SELECT
 
 
+def get_group_keyboard(groups: List[Tuple[str, str]]) -> ReplyKeyboardMarkup:
+    """Reply keyboard with the first page of groups"""
+    labels = [label for _, label in groups[:DIRECTORY_PAGE_SIZE]]
+    keyboard = [labels[i:i+2] for i in range(0, len(labels), 2)]
+    keyboard.append(['❌ Отмена'])
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+
+
+def teacher_search_view(teachers: DirectoryIndex, search: str, offset: int) -> Tuple[str, InlineKeyboardMarkup]:
+    """One page of teacher search results with navigation"""
+    results = teachers.search(search)
+    page = results[offset:offset + DIRECTORY_PAGE_SIZE]
+    
+    if not results:
+        text = f"Никого не найдено по запросу «{search}».\nВведите другую часть фамилии:"
+    elif search:
+        text = f"Найдено: {len(results)}. Выберите себя из списка или уточните запрос:"
+    else:
+        text = "Выберите себя из списка или введите часть фамилии для поиска:"
+    
+    keyboard = [
+        [InlineKeyboardButton(name, callback_data=f"teacher_select_{teacher_id}")]
+        for teacher_id, name in page
+    ]
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton("◀", callback_data=f"teacher_page:{max(offset - DIRECTORY_PAGE_SIZE, 0)}"))
+    if offset + DIRECTORY_PAGE_SIZE < len(results):
+        navigation.append(InlineKeyboardButton("▶", callback_data=f"teacher_page:{offset + DIRECTORY_PAGE_SIZE}"))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def teacher_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Search teachers by typed part of the name"""
+    teachers = await api.teachers_directory.get(api)
+    if not teachers:
+        await update.message.reply_text("❌ Не удалось загрузить список преподавателей.")
+        return ConversationHandler.END
+    
+    context.user_data['teacher_query'] = update.message.text.strip()
+    text, reply_markup = teacher_search_view(teachers, context.user_data['teacher_query'], 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    return TEACHER_SELECT
+
+
 async def teacher_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle teacher selection"""
     query = update.callback_query
@@ -446,8 +2334,17 @@ async def teacher_selected(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await query.edit_message_text("Регистрация отменена.")
         return ConversationHandler.END
     
+    teachers = await api.teachers_directory.get(api)
+    
+    if query.data.startswith("teacher_page:"):
+        if teachers:
+            offset = int(query.data.split(':', 1)[1])
+            text, reply_markup = teacher_search_view(teachers, context.user_data.get('teacher_query', ''), offset)
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        return TEACHER_SELECT
+    
     teacher_id = query.data.replace('teacher_select_', '')
-    teacher_name = context.user_data.get('teachers', {}).get(teacher_id, 'Преподаватель')
+    teacher_name = (teachers.label(teacher_id) if teachers else None) or 'Преподаватель'
     
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
@@ -501,12 +2398,27 @@ async def student_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         )
         return ConversationHandler.END
     
-    # Validate group
-    available_groups = context.user_data.get('available_groups', [])
-    if group not in available_groups:
-        await update.message.reply_text("Пожалуйста, выберите группу из списка.")
+    groups = await api.groups_directory.get(api)
+    if not groups:
+        await update.message.reply_text("Извините, не удалось загрузить список групп. Попробуйте позже.")
+        return STUDENT_GROUP
+    
+    # Exact group, otherwise offer search results
+    match = groups.find(group)
+    if match is None:
+        results = groups.search(group)
+        if not results:
+            await update.message.reply_text("Группа не найдена. Введите номер группы ещё раз:")
+        elif len(results) > DIRECTORY_PAGE_SIZE:
+            await update.message.reply_text(
+                f"Найдено групп: {len(results)}. Выберите из первых {DIRECTORY_PAGE_SIZE} или уточните запрос:",
+                reply_markup=get_group_keyboard(results)
+            )
+        else:
+            await update.message.reply_text("Выберите группу из списка:", reply_markup=get_group_keyboard(results))
         return STUDENT_GROUP
     
+    group = match[1]
     context.user_data['group'] = group
     
     # Ask for subgroup
@@ -617,8 +2529,115 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+def schedule_owner(user_data: dict) -> Tuple[str, str, str]:
+    """(kind, owner, subgroup) whose schedule a user sees"""
+    if user_data.get('role') == 'student':
+        return 'group', user_data['group'], user_data.get('subgroup', 'all')
+    return 'teacher', user_data['teacher_id'], 'all'
+
+
+def render_schedule_view(kind: str, owner: str, subgroup: str, period: str, schedule_data: dict,
+                         day: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Message text and inline keyboard for a schedule response"""
+    if not schedule_data.get('success'):
+        return "❌ Не удалось загрузить расписание. Попробуйте позже.", None
+    
+    sessions = schedule_sessions(schedule_data)
+    if not sessions:
+        period_name = {'today': 'сегодня', 'tomorrow': 'завтра', 'week': 'на эту неделю'}.get(period, period)
+        if kind == 'teacher':
+            return f"📭 У вас нет занятий {period_name}.\n\nОтдыхайте! 😊", None
+        return f"📭 Занятий {period_name} нет.\n\nОтдыхайте! 😊", None
+    
+    if period == 'week':
+        text, reply_markup = render_week_page(kind, owner, subgroup, sessions, day)
+    else:
+        text, reply_markup = render_schedule(kind, owner, subgroup, period, sessions), None
+    if schedule_data.get('degraded'):
+        text += degraded_banner(schedule_data['age'])
+    return text, reply_markup
+
+
+# Telegram rejects longer messages (the hard limit is 4096 characters)
+MESSAGE_LIMIT = 4000
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split a message into parts Telegram accepts, between sessions where possible"""
+    if len(text) <= limit:
+        return [text]
+    parts = []
+    current = ''
+    # Numbered session entries and day titles start with a bold tag on a new line
+    for block in re.split(r'\n(?=<b>)', text):
+        candidate = f"{current}\n{block}" if current else block
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        while len(block) > limit:
+            cut = block.rfind('\n', 0, limit)
+            if cut <= 0:
+                cut = limit
+            parts.append(block[:cut])
+            block = block[cut:].lstrip('\n')
+        current = block
+    if current:
+        parts.append(current)
+    return parts
+
+
+async def reply_schedule(update: Update, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+                         edit: Optional[Message] = None) -> List[Message]:
+    """Send a schedule answer (the first part replacing edit, if given), split when too long"""
+    parts = split_message(text)
+    sent = []
+    for i, part in enumerate(parts):
+        # Buttons go under the end of the answer
+        markup = reply_markup if i == len(parts) - 1 else None
+        if i == 0 and edit is not None:
+            sent.append(await edit.edit_text(part, parse_mode='HTML', reply_markup=markup))
+        else:
+            sent.append(await update.message.reply_text(part, parse_mode='HTML', reply_markup=markup))
+    return sent
+
+
+def degraded_banner(age: float) -> str:
+    loaded_at = datetime.now(LOCAL_TZ) - timedelta(seconds=age)
+    return f"\n\n<i>⚠️ Сервер расписания недоступен, данные на {loaded_at.strftime('%d.%m %H:%M')} могут быть устаревшими</i>"
+
+
+async def build_schedule_view(user_data: dict, period: str,
+                              day: Optional[str] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Message text and inline keyboard for a user's schedule"""
+    kind, owner, subgroup = schedule_owner(user_data)
+    if kind == 'teacher':
+        schedule_data = await api.get_teacher_schedule(owner, period)
+    else:
+        schedule_data = await api.get_schedule(owner, period, subgroup)
+    return render_schedule_view(kind, owner, subgroup, period, schedule_data, day)
+
+
+async def revalidate_schedule_message(message: Optional[Message], user_data: dict, period: str) -> None:
+    """Re-fetch a schedule answered from stale data and replace the reply (if one message) with it"""
+    kind, owner, subgroup = schedule_owner(user_data)
+    try:
+        schedule_data = await api.refresh_schedule(kind, owner, period, subgroup)
+        if not schedule_data.get('success'):
+            return
+        text, reply_markup = render_schedule_view(kind, owner, subgroup, period, schedule_data)
+        # Edited even when the schedule is unchanged: that drops the "data as of" marker from the reply.
+        # Answers split over several messages are not edited in place.
+        if message is not None and len(text) <= MESSAGE_LIMIT:
+            await message.edit_text(text, parse_mode='HTML', reply_markup=reply_markup)
+    except Exception as e:
+        logger.error(f"Failed to revalidate schedule message: {e}")
+
+
 async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE, period: str = 'today') -> None:
     """Show schedule for a period"""
+    started = time.perf_counter()
     user_id = update.effective_user.id
     
     if user_id not in user_data_store:
@@ -628,105 +2647,36 @@ async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE, peri
         return
     
     user_data = user_data_store[user_id]
-    role = user_data.get('role')
+    kind, owner, subgroup = schedule_owner(user_data)
     
-    # Show loading message
-    loading_msg = await update.message.reply_text("⏳ Загружаю расписание...")
-    
-    if role == 'student':
-        group = user_data['group']
-        subgroup = user_data.get('subgroup', 'all')
-        
-        # Get schedule
-        schedule_data = await api.get_schedule(group, period, subgroup)
-        
-        if not schedule_data.get('success'):
-            await loading_msg.edit_text("❌ Не удалось загрузить расписание. Попробуйте позже.")
+    # Answer instantly from local data; stale answers are revalidated in background
+    schedule_data, fresh, age = api.peek_schedule(kind, owner, period, subgroup)
+    if schedule_data is not None:
+        text, reply_markup = render_schedule_view(kind, owner, subgroup, period, schedule_data)
+        if fresh:
+            await reply_schedule(update, text, reply_markup)
+            schedule_reply_latency.observe(time.perf_counter() - started, 'fresh')
             return
-        
-        sessions = schedule_data.get('sessions', [])
-        
-        if not sessions:
-            period_names = {'today': 'сегодня', 'tomorrow': 'завтра', 'week': 'на эту неделю'}
-            await loading_msg.edit_text(
-                f"📭 Занятий {period_names.get(period, period)} нет.\n\n"
-                f"Отдыхайте! 😊"
-            )
+        if not api.breaker.available:
+            # Revalidating would fail fast anyway
+            await reply_schedule(update, text + degraded_banner(age), reply_markup)
+            schedule_reply_latency.observe(time.perf_counter() - started, 'degraded')
             return
         
-        # Format schedule
-        if period == 'week':
-            schedule_dict = schedule_data.get('schedule', {})
-            message = f"📆 <b>Расписание на неделю</b>\n"
-            message += f"Группа: {group}" + (f" (подгруппа {subgroup})" if subgroup != 'all' else '') + "\n\n"
-            
-            for date_str, day_sessions in sorted(schedule_dict.items()):
-                date_obj = datetime.fromisoformat(date_str)
-                day_name = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'][date_obj.weekday()]
-                message += f"<b>{day_name}, {date_obj.strftime('%d.%m')}:</b>\n"
-                
-                for session in day_sessions:
-                    message += format_session(session)
-                message += "\n"
-        else:
-            period_names = {'today': 'Сегодня', 'tomorrow': 'Завтра'}
-            message = f"📅 <b>Расписание на {period_names.get(period, period).lower()}</b>\n"
-            message += f"Группа: {group}" + (f" (подгруппа {subgroup})" if subgroup != 'all' else '') + "\n\n"
-            
-            for i, session in enumerate(sessions, 1):
-                message += f"<b>{i}.</b> "
-                message += format_session(session)
+        loaded_at = datetime.now(LOCAL_TZ) - timedelta(seconds=age)
+        sent = await reply_schedule(update, f"{text}\n\n<i>🕐 Данные на {loaded_at.strftime('%H:%M')}</i>", reply_markup)
+        schedule_reply_latency.observe(time.perf_counter() - started, 'stale')
+        context.application.create_task(
+            revalidate_schedule_message(sent[0] if len(sent) == 1 else None, user_data, period)
+        )
+        return
     
-    else:  # teacher
-        teacher_id = user_data['teacher_id']
-        teacher_name = user_data['name']
-        
-        schedule_data = await api.get_teacher_schedule(teacher_id, period)
-        
-        if not schedule_data.get('success'):
-            await loading_msg.edit_text("❌ Не удалось загрузить расписание. Попробуйте позже.")
-            return
-        
-        sessions = schedule_data.get('sessions', [])
-        
-        if not sessions:
-            period_names = {'today': 'сегодня', 'tomorrow': 'завтра', 'week': 'на эту неделю'}
-            await loading_msg.edit_text(
-                f"📭 У вас нет занятий {period_names.get(period, period)}.\n\n"
-                f"Отдыхайте! 😊"
-            )
-            return
-        
-        # Format schedule
-        if period == 'week':
-            schedule_dict = schedule_data.get('schedule', {})
-            message = f"📆 <b>Ваше расписание на неделю</b>\n\n"
-            
-            for date_str, day_sessions in sorted(schedule_dict.items()):
-                date_obj = datetime.fromisoformat(date_str)
-                day_name = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'][date_obj.weekday()]
-                message += f"<b>{day_name}, {date_obj.strftime('%d.%m')}:</b>\n"
-                
-                for session in day_sessions:
-                    message += format_session(session)
-                    message += f"Группы: {', '.join(session.get('groups', []))}\n\n"
-        else:
-            period_names = {'today': 'Сегодня', 'tomorrow': 'Завтра'}
-            message = f"📅 <b>Ваше расписание на {period_names.get(period, period).lower()}</b>\n\n"
-            
-            for i, session in enumerate(sessions, 1):
-                message += f"<b>{i}.</b> "
-                message += format_session(session)
-                message += f"Группы: {', '.join(session.get('groups', []))}\n\n"
-    
-    # Split message if too long
-    if len(message) > 4000:
-        parts = [message[i:i+4000] for i in range(0, len(message), 4000)]
-        await loading_msg.delete()
-        for part in parts:
-            await update.message.reply_text(part, parse_mode='HTML')
-    else:
-        await loading_msg.edit_text(message, parse_mode='HTML')
+    # Show loading message
+    loading_msg = await update.message.reply_text("⏳ Загружаю расписание...")
+    
+    message, reply_markup = await build_schedule_view(user_data, period)
+    await reply_schedule(update, message, reply_markup, edit=loading_msg)
+    schedule_reply_latency.observe(time.perf_counter() - started, 'fetched')
 
 
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -744,6 +2694,24 @@ async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await show_schedule(update, context, 'week')
 
 
+async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Toggle reminders before classes"""
+    user_id = update.effective_user.id
+    
+    if user_id not in user_data_store:
+        await update.message.reply_text(
+            "Вы не зарегистрированы! Используйте /start для регистрации."
+        )
+        return
+    
+    enabled = not user_data_store[user_id].get('reminders', True)
+    user_data_store.update(user_id, reminders=enabled)
+    if enabled:
+        await update.message.reply_text(f"⏰ Напоминания включены: бот напишет за {REMINDER_MINUTES} минут до пары.")
+    else:
+        await update.message.reply_text("🔕 Напоминания о парах выключены.")
+
+
 async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show user profile"""
     user_id = update.effective_user.id
@@ -798,6 +2766,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 "/tomorrow - Расписание на завтра\n"
                 "/week - Расписание на неделю\n"
                 "/profile - Мой профиль\n"
+                "/reminders - Вкл/выкл напоминания о парах\n"
                 "/help - Справка\n\n"
                 "<b>Также можно использовать кнопки меню!</b>"
             )
@@ -809,6 +2778,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 "/tomorrow - Расписание на завтра\n"
                 "/week - Расписание на неделю\n"
                 "/profile - Мой профиль\n"
+                "/reminders - Вкл/выкл напоминания о парах\n"
                 "/help - Справка\n\n"
                 "<b>Также можно использовать кнопки меню!</b>"
             )
@@ -821,139 +2791,910 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(help_text, parse_mode='HTML')
 
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle inline keyboard callbacks"""
-    query = update.callback_query
-    await query.answer()
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show backend client statistics (admins only)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    
+    cache = api.schedule_cache.stats()
+    snapshots = api.snapshots.stats()
+    rendered = rendered_messages.stats()
+    pool = api.pool_stats.snapshot()
+    poller = notification_poller.stats()
+    reminders = reminder_scheduler.stats()
+    breaker = api.breaker.stats()
+    message = (
+        "<b>📊 Статистика</b>\n\n"
+        "<b>Кэш расписаний:</b>\n"
+        f"Записей: {cache['size']}\n"
+        f"Попаданий: {cache['hits']} (устаревших: {cache['stale_hits']})\n"
+        f"Промахов: {cache['misses']}\n"
+        f"Hit ratio: {cache['hit_ratio']:.1%}\n\n"
+        "<b>Снимки расписаний:</b>\n"
+        f"Групп/преподавателей: {snapshots['owners']}\n"
+        f"Попаданий: {snapshots['hits']}, промахов: {snapshots['misses']}\n"
+        f"Обновлено на месте: {snapshots['patched']}, сброшено: {snapshots['invalidated']}\n\n"
+        "<b>Готовые сообщения:</b>\n"
+        f"Записей: {rendered['size']}, hit ratio: {rendered['hit_ratio']:.1%}\n\n"
+        "<b>Пул соединений:</b>\n"
+        f"Запросов: {pool['requests_started']} (в процессе: {pool['requests_in_flight']})\n"
+        f"Объединено запросов: {api.coalesced_requests}\n"
+        f"Соединений создано: {pool['connections_created']}, переиспользовано: {pool['connections_reused']}\n"
+        f"Ожиданий пула: {pool['pool_waits']} "
+        f"(среднее {pool['pool_wait_avg'] * 1000:.1f} мс, макс. {pool['pool_wait_max'] * 1000:.1f} мс)\n"
+        f"Среднее время запроса: {pool['request_time_avg'] * 1000:.1f} мс\n"
+        f"Предохранитель бэкенда: {breaker['state']} (срабатываний: {breaker['opened']}), "
+        f"в полёте: {breaker['in_flight']}/{BACKEND_MAX_INFLIGHT}, отклонено: {breaker['rejected']}\n"
+        f"Ответов из старых данных: {api.degraded_responses}\n\n"
+        "<b>Уведомления:</b>\n"
+        f"Воркер: {NOTIFICATION_WORKER_ID}\n"
+        f"В очереди: {poller['backlog']}\n"
+        f"Скорость отправки: {poller['drain_rate']:.1f} сообщ./с\n"
+        f"Размер страницы: {poller['page_size']}, интервал опроса: {poller['interval']:.0f} с\n"
+        f"Отправлено: {poller['processed']} (опросов: {poller['polls']}, пустых: {poller['empty_polls']})\n"
+    )
+    if push_receiver:
+        message += f"Получено push-уведомлений: {push_receiver.received}\n"
+    message += (
+        f"Мёртвых чатов: {len(dead_chats)} (пропущено отправок: {notification_dispatcher.short_circuited}), "
+        f"отложено: {notification_dispatcher.deferred}, "
+        f"открытых предохранителей: {notification_dispatcher.breaker.open_count()}\n"
+        f"Подавлено дублей: {notification_dispatcher.deduplicated}, "
+        f"разослано по группам: {notification_dispatcher.fanned_out}\n"
+    )
+    message += f"Напоминаний запланировано: {reminders['scheduled']}, отправлено: {reminders['fired']}\n"
+    message += (
+        f"\n<b>Обновлений в обработке:</b> {context.application.update_queue.in_flight}"
+        f"/{UPDATE_QUEUE_SIZE}\n"
+    )
+    await update.message.reply_text(message, parse_mode='HTML')
+
+
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle inline keyboard callbacks"""
+    query = update.callback_query
+    await query.answer()
+    
+    if query.data.startswith("week:"):
+        user_id = update.effective_user.id
+        if user_id not in user_data_store:
+            await query.edit_message_text("Вы не зарегистрированы! Используйте /start для регистрации.")
+            return
+        
+        message, reply_markup = await build_schedule_view(
+            user_data_store[user_id], 'week', query.data.split(':', 1)[1]
+        )
+        await query.edit_message_text(message, parse_mode='HTML', reply_markup=reply_markup)
+    
+    elif query.data == "logout":
+        user_id = update.effective_user.id
+        if user_id in user_data_store:
+            del user_data_store[user_id]
+            await query.edit_message_text(
+                "✅ Вы вышли из сессии.\n\n"
+                "Используйте /start для новой авторизации."
+            )
+        else:
+            await query.edit_message_text("Сессия не найдена.")
+    
+    elif query.data == "change_role":
+        user_id = update.effective_user.id
+        if user_id in user_data_store:
+            # Delete from backend first
+            await api.delete_user_by_telegram_id(str(user_id))
+            
+            # Delete local data to force re-registration
+            del user_data_store[user_id]
+            
+            await query.edit_message_text(
+                "✅ Ваша роль сброшена.\n\n"
+                "Используйте /start для выбора новой роли."
+            )
+        else:
+            await query.edit_message_text("Сессия не найдена.")
+
+
+async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle reply keyboard buttons"""
+    text = update.message.text
+    user_id = update.effective_user.id
+    
+    if user_id not in user_data_store:
+        await update.message.reply_text(
+            "Вы не зарегистрированы! Используйте /start для регистрации."
+        )
+        return
+    
+    role = user_data_store[user_id].get('role')
+    
+    # Common buttons
+    if text == '👤 Профиль':
+        await profile_command(update, context)
+    elif text == 'ℹ️ Помощь':
+        await help_command(update, context)
+    
+    # Student buttons
+    elif role == 'student':
+        if text == '📅 Сегодня':
+            await today_command(update, context)
+        elif text == '📅 Завтра':
+            await tomorrow_command(update, context)
+        elif text == '📆 Неделя':
+            await week_command(update, context)
+        else:
+            await update.message.reply_text(
+                "Используйте кнопки меню или команды.",
+                reply_markup=get_student_keyboard()
+            )
+    
+    # Teacher buttons
+    elif role == 'teacher':
+        if text == '📅 Моё расписание сегодня':
+            await today_command(update, context)
+        elif text == '📅 Моё расписание завтра':
+            await tomorrow_command(update, context)
+        elif text == '📆 Моё расписание на неделю':
+            await week_command(update, context)
+        else:
+            await update.message.reply_text(
+                "Используйте кнопки меню или команды.",
+                reply_markup=get_teacher_keyboard()
+            )
+
+
+class TokenBucket:
+    """Token bucket rate limiter with support for forced back-off (RetryAfter)"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self) -> float:
+        """Seconds until a token can be taken"""
+        self._refill()
+        blocked = self.blocked_until - time.monotonic()
+        missing = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(blocked, missing, 0.0)
+    
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now"""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep(self.delay())
+    
+    def block(self, seconds: float) -> None:
+        """Refuse tokens for the given number of seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    def is_idle(self) -> bool:
+        """True if the bucket is full and not blocked, i.e. safe to discard"""
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+class NotificationStatusBatcher:
+    """Buffers notification delivery outcomes and reports them to backend in bulk"""
+    
+    def __init__(self, batch_size: int, flush_interval: float, max_buffer: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._flush_tasks: set = set()
+    
+    def add(self, notification_id: str, status: str, error: Optional[str] = None) -> None:
+        """Queue a status update; flushes once batch_size or flush_interval is reached"""
+        update = {'notificationId': notification_id, 'status': status}
+        if error:
+            update['error'] = error
+        self._buffer.append(update)
+        
+        if len(self._buffer) >= self.batch_size:
+            task = asyncio.create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+    
+    async def flush(self) -> None:
+        """Send all buffered updates"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:self.batch_size]
+                if not await api.update_notification_statuses(batch):
+                    # Keep updates for the next flush, dropping the oldest if backend stays down
+                    self._buffer[:0] = batch
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        logger.error(f"Dropping {overflow} notification status updates")
+                        del self._buffer[:overflow]
+                    break
+    
+    async def close(self) -> None:
+        """Flush remaining updates on shutdown"""
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+        await self.flush()
+
+
+class ChatCircuitBreaker:
+    """Per-chat circuit breaker for transient send failures"""
+    
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+    
+    def allow(self, chat_id: str) -> bool:
+        """False while the breaker is open; after the cooldown one attempt is let through"""
+        open_until = self._open_until.get(chat_id)
+        if open_until is None:
+            return True
+        if time.monotonic() < open_until:
+            return False
+        # Half-open: the next failure opens it again right away
+        del self._open_until[chat_id]
+        self._failures[chat_id] = self.threshold - 1
+        return True
+    
+    def record_success(self, chat_id: str) -> None:
+        self._failures.pop(chat_id, None)
+        self._open_until.pop(chat_id, None)
+    
+    def record_failure(self, chat_id: str) -> None:
+        failures = self._failures.get(chat_id, 0) + 1
+        self._failures[chat_id] = failures
+        if failures >= self.threshold:
+            self._open_until[chat_id] = time.monotonic() + self.cooldown
+    
+    def open_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for until in self._open_until.values() if until > now)
+
+
+class DeliveryTracker:
+    """Delivery state of one notification sent to one or more chats"""
+    
+    __slots__ = ('notification_id', 'remaining', 'delivered', 'deferred', 'error', 'report', 'lease_deadline')
+    
+    def __init__(self, notification_id: str, chats: int, report: bool, lease_deadline: Optional[float] = None):
+        self.notification_id = notification_id
+        self.remaining = chats
+        self.delivered = False
+        self.deferred = False
+        self.error: Optional[str] = None
+        self.report = report
+        # Monotonic time after which the backend may give the notification to another worker
+        self.lease_deadline = lease_deadline
+
+
+class NotificationDispatcher:
+    """Sends notifications in parallel within Telegram's global and per-chat rate limits"""
+    
+    def __init__(self, workers: int, global_rate: float, chat_rate: float, max_retries: int,
+                 status_batcher: NotificationStatusBatcher, dedupe_window: int = 0):
+        self.workers = workers
+        self.dedupe_window = dedupe_window
+        self.status_batcher = status_batcher
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        # Ids already taken for sending, so pushed and polled copies are sent once
+        self._seen_ids: 'OrderedDict[str, None]' = OrderedDict()
+        self._seen_limit = 10000
+        # (chat id, message hash) -> expiry of the duplicate suppression window
+        self._recent: 'OrderedDict[Tuple[str, int], float]' = OrderedDict()
+        self._recent_limit = 100000
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.fanned_out = 0
+        self.breaker = ChatCircuitBreaker(CHAT_BREAKER_THRESHOLD, CHAT_BREAKER_COOLDOWN)
+        # Times a notification was left pending after transient failures
+        self._deferrals: 'OrderedDict[str, int]' = OrderedDict()
+        self.deferred = 0
+        self.short_circuited = 0
+    
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket
+    
+    async def dispatch(self, bot, notifications: List[dict]) -> None:
+        """Send a batch of notifications and report their delivery status"""
+        # Messages for one chat stay in order; chats are served round-robin
+        pending: Dict[str, deque] = {}
+        now = time.monotonic()
+        for notification in notifications:
+            notification_id = str(notification['_id'])
+            if notification_id in self._seen_ids:
+                continue
+            self._seen_ids[notification_id] = None
+            if len(self._seen_ids) > self._seen_limit:
+                self._seen_ids.popitem(last=False)
+            
+            payload = notification.get('payload') or {}
+            message = payload.get('message', '')
+            data = payload.get('data') or {}
+            chat_id = data.get('chatId')
+            # Notifications addressed to groups instead of a chat fan out to their students
+            chat_ids = [str(chat_id)] if chat_id else await self._group_chats(notification)
+            
+            if not chat_ids or not message:
+                logger.warning(f"Notification {notification_id} missing chatId or message")
+                self.status_batcher.add(notification_id, 'failed', 'Missing chatId or message')
+                continue
+            
+            # Locally generated messages (reminders) have no backend status to report
+            report = not notification.get('local')
+            digest = hash(message)
+            targets = []
+            dead = 0
+            for target in chat_ids:
+                if target in dead_chats:
+                    # Known dead chat: don't spend a Telegram call on it
+                    self.short_circuited += 1
+                    dead += 1
+                    continue
+                if self._is_duplicate(target, digest, now):
+                    self.deduplicated += 1
+                    continue
+                self._recent[(target, digest)] = now + self.dedupe_window
+                targets.append(target)
+            
+            if not targets:
+                if report and dead == len(chat_ids):
+                    self.status_batcher.add(notification_id, 'failed', 'User blocked bot or chat not found')
+                elif report:
+                    # Same text already reached these chats
+                    self.status_batcher.add(notification_id, 'sent')
+                continue
+            
+            if len(targets) > 1:
+                self.fanned_out += len(targets)
+            delivery = DeliveryTracker(notification_id, len(targets), report, notification.get('leaseDeadline'))
+            for target in targets:
+                pending.setdefault(target, deque()).append([message, 0, delivery])
+        
+        while len(self._recent) > self._recent_limit:
+            self._recent.popitem(last=False)
+        
+        if not pending:
+            await self.status_batcher.flush()
+            return
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in pending:
+            queue.put_nowait(chat_id)
+        
+        workers = [
+            asyncio.create_task(self._worker(bot, queue, pending))
+            for _ in range(min(self.workers, len(pending)))
+        ]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._prune_buckets()
+            await self.status_batcher.flush()
+            dispatch_batch_latency.observe(time.monotonic() - now)
+    
+    async def _worker(self, bot, queue: asyncio.Queue, pending: Dict[str, deque]) -> None:
+        while True:
+            chat_id = await queue.get()
+            try:
+                if not self.breaker.allow(chat_id) or chat_id in dead_chats:
+                    # Leave the chat's messages for a later attempt (or fail them if it is dead)
+                    while pending[chat_id]:
+                        message, _, delivery = pending[chat_id].popleft()
+                        if chat_id in dead_chats:
+                            self._report_failure(delivery, chat_id, message, 'User blocked bot or chat not found')
+                        else:
+                            self._defer(delivery, chat_id, message, 'Chat circuit breaker is open')
+                    continue
+                
+                bucket = self._chat_bucket(chat_id)
+                wait = bucket.delay()
+                if wait > 0 and not queue.empty():
+                    # Chat is rate limited or backing off: let other chats go first
+                    await asyncio.sleep(min(wait, 0.05))
+                    queue.put_nowait(chat_id)
+                    continue
+                
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                
+                item = pending[chat_id][0]
+                lease_deadline = item[2].lease_deadline
+                if lease_deadline is not None and time.monotonic() > lease_deadline:
+                    # Another worker may hold the claim by now; it sends the notification instead
+                    pending[chat_id].popleft()
+                    self._defer(item[2], chat_id, item[0], 'Notification lease expired')
+                elif await self._send(bot, chat_id, item, bucket):
+                    pending[chat_id].popleft()
+                
+                if pending[chat_id]:
+                    queue.put_nowait(chat_id)
+            except Exception as e:
+                logger.error(f"Notification worker error for chat {chat_id}: {e}")
+            finally:
+                queue.task_done()
+    
+    def _is_duplicate(self, chat_id: str, digest: int, now: float) -> bool:
+        expires = self._recent.get((chat_id, digest))
+        if expires is None:
+            return False
+        if expires <= now:
+            del self._recent[(chat_id, digest)]
+            return False
+        return True
+    
+    async def _group_chats(self, notification: dict) -> List[str]:
+        """Chats of registered students in the notification's groups"""
+        session = notification.get('session')
+        subgroup = session.get('subgroup', 'all') if isinstance(session, dict) else 'all'
+        groups = (notification.get('recipients') or {}).get('groups') or []
+        user_ids = []
+        for group in groups:
+            user_ids.extend(user_data_store.ids_in_group(str(group), None if subgroup == 'all' else subgroup))
+        # Users whose record is gone (logged out in another process) are left out
+        records = await user_data_store.get_many(user_ids)
+        return [str(records[user_id].get('chat_id', user_id)) for user_id in user_ids if user_id in records]
+    
+    def _complete(self, delivery: DeliveryTracker, error: Optional[str] = None, deferred: bool = False) -> None:
+        delivery.remaining -= 1
+        if error is None:
+            delivery.delivered = True
+        else:
+            delivery.error = error
+            delivery.deferred = delivery.deferred or deferred
+        if delivery.remaining > 0 or not delivery.report:
+            return
+        
+        notification_id = delivery.notification_id
+        if delivery.delivered:
+            self._deferrals.pop(notification_id, None)
+            self.status_batcher.add(notification_id, 'sent')
+        elif delivery.deferred and self._deferrals.get(notification_id, 0) < NOTIFICATION_MAX_DEFERRALS:
+            # Keep it pending on backend; the next poll picks it up again
+            self._deferrals[notification_id] = self._deferrals.get(notification_id, 0) + 1
+            if len(self._deferrals) > self._seen_limit:
+                self._deferrals.popitem(last=False)
+            self._seen_ids.pop(notification_id, None)
+        else:
+            self._deferrals.pop(notification_id, None)
+            self.status_batcher.add(notification_id, 'failed', delivery.error)
+    
+    def _defer(self, delivery: DeliveryTracker, chat_id: str, message: str, reason: str) -> None:
+        self.deferred += 1
+        self._recent.pop((chat_id, hash(message)), None)
+        logger.warning(f"Deferring notification {delivery.notification_id} for chat {chat_id}: {reason}")
+        self._complete(delivery, reason, deferred=True)
+    
+    async def _send(self, bot, chat_id: str, item: list, bucket: TokenBucket) -> bool:
+        """Send one notification; returns False if it should be retried later"""
+        message, attempts, delivery = item
+        notification_id = delivery.notification_id
+        try:
+            await self._send_message(bot, chat_id, message)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            item[1] = attempts + 1
+            if item[1] <= self.max_retries:
+                logger.warning(f"Flood control for chat {chat_id}, retrying in {retry_after}s")
+                bucket.block(retry_after)
+                return False
+            self._defer(delivery, chat_id, message, str(e))
+            return True
+        except Forbidden as e:
+            # Bot blocked, kicked or user deactivated: the chat is dead until it writes again
+            dead_chats.add(chat_id, str(e))
+            self._report_failure(delivery, chat_id, message, 'User blocked bot or chat not found')
+            return True
+        except BadRequest as e:
+            if 'chat not found' in str(e).lower():
+                dead_chats.add(chat_id, str(e))
+                self._report_failure(delivery, chat_id, message, 'User blocked bot or chat not found')
+            else:
+                # The message itself was rejected; the chat is fine
+                self._report_failure(delivery, chat_id, message, str(e))
+            return True
+        except NetworkError as e:
+            # Timeouts and connection errors are transient: back off exponentially, then defer
+            self.breaker.record_failure(chat_id)
+            item[1] = attempts + 1
+            if item[1] <= self.max_retries and self.breaker.allow(chat_id):
+                backoff = min(NOTIFICATION_RETRY_BASE * 2 ** attempts, NOTIFICATION_RETRY_MAX)
+                logger.warning(f"Transient error for chat {chat_id} ({e}), retrying in {backoff}s")
+                bucket.block(backoff)
+                return False
+            self._defer(delivery, chat_id, message, str(e))
+            return True
+        except Exception as send_error:
+            self._report_failure(delivery, chat_id, message, str(send_error))
+            return True
+        
+        self.sent += 1
+        self.breaker.record_success(chat_id)
+        self._complete(delivery)
+        logger.info(f"Successfully sent notification {notification_id} to chat {chat_id}")
+        return True
+    
+    async def _send_message(self, bot, chat_id: str, message: str) -> None:
+        """sendMessage with its latency recorded by outcome"""
+        started = time.perf_counter()
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            telegram_send_latency.observe(time.perf_counter() - started, type(e).__name__)
+            raise
+        telegram_send_latency.observe(time.perf_counter() - started, 'ok')
+    
+    def _report_failure(self, delivery: DeliveryTracker, chat_id: str, message: str, error_msg: str) -> None:
+        self.failed += 1
+        # Not delivered, so a repeat of this message must not be suppressed
+        self._recent.pop((chat_id, hash(message)), None)
+        logger.error(f"Failed to send notification {delivery.notification_id}: {error_msg}")
+        self._complete(delivery, error_msg)
+    
+    def _prune_buckets(self) -> None:
+        for chat_id in [c for c, bucket in self.chat_buckets.items() if bucket.is_idle()]:
+            del self.chat_buckets[chat_id]
+
+
+status_batcher = NotificationStatusBatcher(STATUS_BATCH_SIZE, STATUS_FLUSH_INTERVAL)
+notification_dispatcher = NotificationDispatcher(
+    NOTIFICATION_WORKERS, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, NOTIFICATION_MAX_RETRIES,
+    status_batcher, NOTIFICATION_DEDUPE_WINDOW
+)
+
+
+class ReminderScheduler:
+    """Upcoming class reminders in one min-heap, resynced per group/teacher when schedules change"""
     
-    if query.data == "logout":
-        user_id = update.effective_user.id
-        if user_id in user_data_store:
-            del user_data_store[user_id]
-            await query.edit_message_text(
-                "✅ Вы вышли из сессии.\n\n"
-                "Используйте /start для новой авторизации."
-            )
-        else:
-            await query.edit_message_text("Сессия не найдена.")
+    def __init__(self, lead_minutes: int):
+        self.lead = lead_minutes * 60
+        self._heap: List[Tuple[float, int, Tuple[str, str, str]]] = []
+        self._seq = itertools.count()
+        # (kind, owner, session id) -> (fire time, session); heap entries not matching it are stale
+        self._pending: Dict[Tuple[str, str, str], Tuple[float, Session]] = {}
+        self._by_owner: Dict[Tuple[str, str], Set[str]] = {}
+        # (session id, start) already reminded -> start timestamp, so resyncs don't repeat them
+        self._fired: Dict[Tuple[str, datetime], float] = {}
+        self.fired = 0
     
-    elif query.data == "change_role":
-        user_id = update.effective_user.id
-        if user_id in user_data_store:
-            # Delete from backend first
-            await api.delete_user_by_telegram_id(str(user_id))
-            
-            # Delete local data to force re-registration
-            del user_data_store[user_id]
+    def sync_owner(self, kind: str, owner: str, sessions: Iterable[Session], now: Optional[float] = None) -> None:
+        """Make scheduled reminders of one group/teacher match its upcoming sessions"""
+        now = now if now is not None else time.time()
+        desired: Dict[str, Tuple[float, Session]] = {}
+        for session in sessions:
+            session_id = str(session.id)
+            start = session.start.timestamp()
+            if start > now and (session_id, session.start) not in self._fired:
+                desired[session_id] = (start - self.lead, session)
+        
+        for session_id in self._by_owner.pop((kind, owner), set()) - desired.keys():
+            self._pending.pop((kind, owner, session_id), None)
+        for session_id, (fire_at, session) in desired.items():
+            key = (kind, owner, session_id)
+            current = self._pending.get(key)
+            if current is None or current[0] != fire_at:
+                heapq.heappush(self._heap, (fire_at, next(self._seq), key))
+            self._pending[key] = (fire_at, session)
+        if desired:
+            self._by_owner[(kind, owner)] = set(desired)
+    
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[str, str, Session]]:
+        """Remove and return (kind, owner, session) reminders that are due"""
+        now = now if now is not None else time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, key = heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            if entry is None or entry[0] != fire_at:
+                continue
+            del self._pending[key]
+            kind, owner, session_id = key
+            self._by_owner.get((kind, owner), set()).discard(session_id)
             
-            await query.edit_message_text(
-                "✅ Ваша роль сброшена.\n\n"
-                "Используйте /start для выбора новой роли."
-            )
-        else:
-            await query.edit_message_text("Сессия не найдена.")
+            session = entry[1]
+            start = fire_at + self.lead
+            self._fired[(session_id, session.start)] = start
+            if start > now:
+                due.append((kind, owner, session))
+        
+        for fired_key in [k for k, start in self._fired.items() if start <= now]:
+            del self._fired[fired_key]
+        self.fired += len(due)
+        return due
+    
+    def stats(self) -> dict:
+        return {'scheduled': len(self._pending), 'fired': self.fired}
 
 
-async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle reply keyboard buttons"""
-    text = update.message.text
-    user_id = update.effective_user.id
-    
-    if user_id not in user_data_store:
-        await update.message.reply_text(
-            "Вы не зарегистрированы! Используйте /start для регистрации."
-        )
+reminder_scheduler = ReminderScheduler(REMINDER_MINUTES)
+
+
+def sync_reminders(kind: str, owner: str) -> None:
+    """Reschedule reminders of a group/teacher from locally available schedule data"""
+    sessions = []
+    has_users = user_data_store.ids_for_teacher(owner) if kind == 'teacher' else user_data_store.ids_in_group(owner)
+    if not has_users:
+        reminder_scheduler.sync_owner(kind, owner, sessions)
         return
+    for period in ('today', 'tomorrow'):
+        schedule_data, _, _ = api.peek_schedule(kind, owner, period, count_hit=False)
+        if schedule_data and schedule_data.get('success'):
+            sessions.extend(schedule_sessions(schedule_data))
+    reminder_scheduler.sync_owner(kind, owner, sessions)
+
+
+async def reminder_recipients(kind: str, owner: str, session: Session) -> Dict[int, dict]:
+    """Records of users who see the session in their schedule and have reminders on"""
+    if kind == 'teacher':
+        user_ids = user_data_store.ids_for_teacher(owner)
+    else:
+        subgroup = session.subgroup
+        user_ids = user_data_store.ids_in_group(owner, None if subgroup == 'all' else subgroup)
+    records = await user_data_store.get_many(user_ids)
+    return {user_id: record for user_id, record in records.items() if record.get('reminders', True)}
+
+
+async def refresh_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Load missing schedules of active groups/teachers and resync their reminders"""
+    owners = [('group', group) for group in user_data_store.group_subgroups()]
+    owners += [('teacher', teacher_id) for teacher_id in user_data_store.teacher_ids()]
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
     
-    role = user_data_store[user_id].get('role')
+    async def refresh(kind: str, owner: str) -> None:
+        if api.peek_schedule(kind, owner, 'today', count_hit=False)[0] is None:
+            async with semaphore:
+                # Stored snapshots resync reminders through the snapshot listener
+                await api.warm_snapshot(kind, owner)
+        sync_reminders(kind, owner)
     
-    # Common buttons
-    if text == '👤 Профиль':
-        await profile_command(update, context)
-    elif text == 'ℹ️ Помощь':
-        await help_command(update, context)
+    await asyncio.gather(*(refresh(kind, owner) for kind, owner in owners), return_exceptions=True)
+
+
+async def send_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send reminders that are due through the notification dispatcher"""
+    notifications = []
+    for kind, owner, session in reminder_scheduler.pop_due():
+        message = f"⏰ <b>Пара через {REMINDER_MINUTES} минут</b>\n\n{format_session(session)}"
+        if kind == 'teacher':
+            message += f"Группы: {', '.join(session.groups)}\n"
+        for user_id, record in (await reminder_recipients(kind, owner, session)).items():
+            notifications.append({
+                '_id': f"reminder:{session.id}:{session.start.isoformat()}:{user_id}",
+                'local': True,
+                'payload': {
+                    'message': message,
+                    'data': {'chatId': record.get('chat_id', user_id)},
+                },
+            })
     
-    # Student buttons
-    elif role == 'student':
-        if text == '📅 Сегодня':
-            await today_command(update, context)
-        elif text == '📅 Завтра':
-            await tomorrow_command(update, context)
-        elif text == '📆 Неделя':
-            await week_command(update, context)
-        else:
-            await update.message.reply_text(
-                "Используйте кнопки меню или команды.",
-                reply_markup=get_student_keyboard()
-            )
+    if notifications:
+        logger.info(f"Sending {len(notifications)} class reminders")
+        await notification_dispatcher.dispatch(context.bot, notifications)
+
+
+class NotificationPoller:
+    """Adaptive notification polling: drains full pages back to back, backs off when idle"""
     
-    # Teacher buttons
-    elif role == 'teacher':
-        if text == '📅 Моё расписание сегодня':
-            await today_command(update, context)
-        elif text == '📅 Моё расписание завтра':
-            await tomorrow_command(update, context)
-        elif text == '📆 Моё расписание на неделю':
-            await week_command(update, context)
-        else:
-            await update.message.reply_text(
-                "Используйте кнопки меню или команды.",
-                reply_markup=get_teacher_keyboard()
-            )
+    def __init__(self, dispatcher: NotificationDispatcher, min_interval: float, max_interval: float,
+                 page_size: int, min_page_size: int, max_page_size: int, page_target_seconds: float):
+        self.dispatcher = dispatcher
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_page_size = min_page_size
+        self.max_page_size = max_page_size
+        self.page_target_seconds = page_target_seconds
+        self.page_size = page_size
+        self.interval = min_interval
+        self.backlog = 0
+        self.drain_rate = 0.0
+        self.processed = 0
+        self.polls = 0
+        self.empty_polls = 0
+        self._last_ids: set = set()
+    
+    async def poll(self, bot) -> float:
+        """Process pending notifications until the queue is empty; returns seconds until next poll"""
+        while True:
+            # Acknowledge everything already sent (e.g. pushed notifications) before asking for more
+            await self.dispatcher.status_batcher.flush()
+            page_size = self.page_size
+            self.polls += 1
+            notifications, pending_total = await api.get_pending_notifications_page(limit=page_size)
+            
+            if not notifications:
+                self.empty_polls += 1
+                self.backlog = pending_total or 0
+                self.interval = min(self.interval * 2, self.max_interval)
+                return self.interval
+            
+            ids = {str(n.get('_id')) for n in notifications}
+            if ids & self._last_ids:
+                # Statuses of the previous page did not reach backend yet; don't resend in a tight loop
+                logger.warning("Pending notifications were not acknowledged, backing off")
+                self._last_ids = set()
+                self.interval = self.max_interval
+                return self.interval
+            self._last_ids = ids
+            
+            logger.info(f"Processing {len(notifications)} pending notifications")
+            api.apply_schedule_changes(notifications)
+            started = time.monotonic()
+            await self.dispatcher.dispatch(bot, notifications)
+            self._record_page(len(notifications), time.monotonic() - started)
+            
+            if pending_total is not None:
+                self.backlog = max(pending_total - len(notifications), 0)
+            self.interval = self.min_interval
+            
+            if len(notifications) < page_size:
+                return self.interval
+    
+    def _record_page(self, count: int, elapsed: float) -> None:
+        self.processed += count
+        rate = count / max(elapsed, 1e-3)
+        # Exponentially weighted drain rate, used to size the next page
+        self.drain_rate = rate if self.drain_rate == 0 else 0.7 * self.drain_rate + 0.3 * rate
+        target = int(self.drain_rate * self.page_target_seconds)
+        self.page_size = max(self.min_page_size, min(self.max_page_size, target))
+    
+    def stats(self) -> dict:
+        """Backlog and throughput metrics"""
+        return {
+            'backlog': self.backlog,
+            'drain_rate': self.drain_rate,
+            'page_size': self.page_size,
+            'interval': self.interval,
+            'processed': self.processed,
+            'polls': self.polls,
+            'empty_polls': self.empty_polls,
+        }
 
 
-async def process_notifications(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Background task to process pending notifications"""
-    try:
-        # Fetch pending notifications
-        notifications = await api.get_pending_notifications(limit=50)
+notification_poller = NotificationPoller(
+    notification_dispatcher,
+    NOTIFICATION_MIN_INTERVAL,
+    NOTIFICATION_CHECK_INTERVAL,
+    NOTIFICATION_PAGE_SIZE,
+    NOTIFICATION_MIN_PAGE_SIZE,
+    NOTIFICATION_MAX_PAGE_SIZE,
+    NOTIFICATION_PAGE_TARGET_SECONDS,
+)
+
+
+class NotificationPushReceiver:
+    """Optional HTTP endpoint the backend pushes new notifications to"""
+    
+    def __init__(self, dispatcher: NotificationDispatcher, host: str, port: int, api_key: str, queue_size: int):
+        self.dispatcher = dispatcher
+        self.host = host
+        self.port = port
+        self.api_key = api_key
+        self.received = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._consumer: Optional[asyncio.Task] = None
+    
+    async def start(self, bot) -> None:
+        """Start the HTTP server and the consumer feeding the dispatcher"""
+        app = web.Application()
+        app.router.add_post('/notifications', self._handle_push)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._consumer = asyncio.create_task(self._consume(bot))
+        logger.info(f"Notification push receiver listening on {self.host}:{self.port}")
+    
+    async def stop(self) -> None:
+        """Stop accepting pushes; undelivered ones stay pending on backend for polling"""
+        if self._consumer:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+    
+    async def _handle_push(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get('x-api-key', ''), self.api_key):
+            return web.json_response({'success': False, 'message': 'Invalid API key'}, status=401)
         
-        if not notifications:
-            return
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.json_response({'success': False, 'message': 'Invalid JSON'}, status=400)
         
-        logger.info(f"Processing {len(notifications)} pending notifications")
+        notifications = data.get('notifications') if isinstance(data, dict) else None
+        if isinstance(data, dict) and isinstance(data.get('broadcasts'), list):
+            notifications = expand_broadcasts([b for b in data['broadcasts'] if isinstance(b, dict)])
+        if not isinstance(notifications, list):
+            return web.json_response({'success': False, 'message': 'notifications must be a list'}, status=400)
         
+        accepted = 0
         for notification in notifications:
-            try:
-                notification_id = str(notification['_id'])
-                payload = notification.get('payload') or {}
-                message = payload.get('message', '')
-                data = payload.get('data') or {}
-                chat_id = data.get('chatId')
-                
-                if not chat_id or not message:
-                    logger.warning(f"Notification {notification_id} missing chatId or message")
-                    await api.update_notification_status(notification_id, 'failed', 'Missing chatId or message')
-                    continue
-                
-                # Send message to user
-                try:
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                    
-                    # Update status to sent
-                    await api.update_notification_status(notification_id, 'sent')
-                    logger.info(f"Successfully sent notification {notification_id} to chat {chat_id}")
-                    
-                except Exception as send_error:
-                    error_msg = str(send_error)
-                    logger.error(f"Failed to send notification {notification_id}: {error_msg}")
-                    
-                    # Check if user blocked the bot
-                    if 'bot was blocked by the user' in error_msg.lower() or 'chat not found' in error_msg.lower():
-                        await api.update_notification_status(notification_id, 'failed', 'User blocked bot or chat not found')
-                    else:
-                        await api.update_notification_status(notification_id, 'failed', error_msg)
-                
-            except Exception as notif_error:
-                logger.error(f"Error processing notification: {notif_error}")
+            if not isinstance(notification, dict) or '_id' not in notification:
                 continue
+            try:
+                self._queue.put_nowait(notification)
+            except asyncio.QueueFull:
+                # The rest stays pending on backend and will be picked up by polling
+                logger.warning("Notification push queue is full")
+                break
+            accepted += 1
         
+        self.received += accepted
+        return web.json_response({'success': True, 'accepted': accepted}, status=202)
+    
+    async def _consume(self, bot) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty() and len(batch) < NOTIFICATION_MAX_PAGE_SIZE:
+                batch.append(self._queue.get_nowait())
+            
+            try:
+                logger.info(f"Processing {len(batch)} pushed notifications")
+                api.apply_schedule_changes(batch)
+                await self.dispatcher.dispatch(bot, batch)
+            except Exception as e:
+                logger.error(f"Error processing pushed notifications: {e}")
+
+
+push_receiver: Optional[NotificationPushReceiver] = None
+metrics_server: Optional[MetricsServer] = None
+
+
+async def process_notifications(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Background task to process pending notifications"""
+    delay = NOTIFICATION_CHECK_INTERVAL
+    try:
+        delay = await notification_poller.poll(context.bot)
     except Exception as e:
         logger.error(f"Error in notification processing task: {e}")
+    finally:
+        # Reschedule ourselves with the adaptive delay
+        context.job_queue.run_once(process_notifications, when=delay, name='process_notifications')
+
+
+async def revive_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """A chat that writes to the bot again can receive messages"""
+    if update.effective_chat:
+        dead_chats.discard(str(update.effective_chat.id))
 
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -966,20 +3707,213 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
 
 
+def parse_prefetch_schedule(value: str) -> Dict[str, List[str]]:
+    """Parse PREFETCH_SCHEDULE into {"HH:MM": [periods]}"""
+    result: Dict[str, List[str]] = {}
+    for entry in filter(None, (item.strip() for item in value.split(','))):
+        at, _, period = entry.partition('=')
+        if period not in ('today', 'tomorrow', 'week'):
+            logger.error(f"Ignoring invalid PREFETCH_SCHEDULE entry: {entry}")
+            continue
+        result.setdefault(at.strip(), []).append(period)
+    return result
+
+
+async def prefetch_owner(kind: str, owner: str, subgroups: Iterable[str], periods: List[str]) -> None:
+    """Fetch and render the schedules of one group or teacher"""
+    await api.warm_snapshot(kind, owner)
+    for period in periods:
+        for subgroup in subgroups:
+            schedule_data, fresh, _ = api.peek_schedule(kind, owner, period, subgroup, count_hit=False)
+            if schedule_data is None or not fresh:
+                # Periods a snapshot doesn't cover (e.g. a teacher's tomorrow on Sunday)
+                schedule_data = await api.refresh_schedule(kind, owner, period, subgroup)
+            render_schedule_view(kind, owner, subgroup, period, schedule_data)
+
+
+async def prefetch_schedules(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Warm schedules of all active groups and teachers before a peak window"""
+    periods = context.job.data
+    owners = [('group', group, sorted(subgroups)) for group, subgroups in user_data_store.group_subgroups().items()]
+    owners += [('teacher', teacher_id, ['all']) for teacher_id in user_data_store.teacher_ids()]
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    started = time.monotonic()
+    
+    async def warm(kind: str, owner: str, subgroups: List[str]) -> bool:
+        # Jitter spreads the requests instead of hitting backend all at once
+        await asyncio.sleep(random.uniform(0, PREFETCH_JITTER))
+        async with semaphore:
+            try:
+                await prefetch_owner(kind, owner, subgroups, periods)
+                return True
+            except Exception as e:
+                logger.error(f"Failed to prefetch schedule for {kind} {owner}: {e}")
+                return False
+    
+    results = await asyncio.gather(*(warm(*owner) for owner in owners))
+    logger.info(
+        f"Prefetched {', '.join(periods)} schedules for {sum(results)}/{len(owners)} "
+        f"groups and teachers in {time.monotonic() - started:.1f}s"
+    )
+
+
+async def flush_user_store(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Background task persisting changed user records"""
+    await user_data_store.flush()
+
+
+async def sync_shared_state(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Background task picking up users and dead chats written by other worker processes"""
+    try:
+        changed = await user_data_store.sync()
+        await dead_chats.sync()
+    except Exception as e:
+        logger.error(f"Failed to sync shared state: {e}")
+        return
+    if changed:
+        logger.info(f"Re-indexed {changed} users changed by other workers")
+
+
+def collect_runtime_metrics(application: Application) -> Iterable[Tuple[str, str, str, dict, float]]:
+    """Counters and gauges read from the components' own statistics at scrape time"""
+    cache = api.schedule_cache.stats()
+    yield 'schedule_bot_schedule_cache_requests_total', 'counter', 'Schedule cache lookups', {'result': 'hit'}, cache['hits']
+    yield 'schedule_bot_schedule_cache_requests_total', 'counter', 'Schedule cache lookups', {'result': 'stale'}, cache['stale_hits']
+    yield 'schedule_bot_schedule_cache_requests_total', 'counter', 'Schedule cache lookups', {'result': 'miss'}, cache['misses']
+    yield 'schedule_bot_cache_entries', 'gauge', 'Entries in local caches', {'cache': 'schedule'}, cache['size']
+    
+    snapshots = api.snapshots.stats()
+    yield 'schedule_bot_snapshot_requests_total', 'counter', 'Schedule snapshot lookups', {'result': 'hit'}, snapshots['hits']
+    yield 'schedule_bot_snapshot_requests_total', 'counter', 'Schedule snapshot lookups', {'result': 'miss'}, snapshots['misses']
+    yield 'schedule_bot_cache_entries', 'gauge', 'Entries in local caches', {'cache': 'snapshot'}, snapshots['owners']
+    
+    for name, render_cache in (('message', rendered_messages), ('fragment', session_fragments)):
+        rendered = render_cache.stats()
+        yield 'schedule_bot_render_cache_requests_total', 'counter', 'Render cache lookups', {'cache': name, 'result': 'hit'}, rendered['hits']
+        yield 'schedule_bot_render_cache_requests_total', 'counter', 'Render cache lookups', {'cache': name, 'result': 'miss'}, rendered['misses']
+        yield 'schedule_bot_cache_entries', 'gauge', 'Entries in local caches', {'cache': name}, rendered['size']
+    
+    pool = api.pool_stats.snapshot()
+    breaker = api.breaker.stats()
+    yield 'schedule_bot_backend_requests_in_flight', 'gauge', 'HTTP requests to backend in flight', {}, pool['requests_in_flight']
+    yield 'schedule_bot_backend_coalesced_requests_total', 'counter', 'GET requests joined to one in flight', {}, api.coalesced_requests
+    yield 'schedule_bot_backend_rejected_total', 'counter', 'Backend calls refused by the circuit breaker', {}, breaker['rejected']
+    yield 'schedule_bot_backend_circuit_open', 'gauge', '1 while the backend circuit breaker is open', {}, int(breaker['state'] == 'open')
+    yield 'schedule_bot_degraded_responses_total', 'counter', 'Schedules served from last good data', {}, api.degraded_responses
+    
+    poller = notification_poller.stats()
+    yield 'schedule_bot_notification_backlog', 'gauge', 'Notifications pending on backend', {}, poller['backlog']
+    yield 'schedule_bot_notification_drain_rate', 'gauge', 'Notification delivery rate, messages per second', {}, poller['drain_rate']
+    for result in ('sent', 'failed', 'deferred', 'deduplicated', 'short_circuited'):
+        yield ('schedule_bot_notifications_total', 'counter', 'Notification deliveries by outcome',
+               {'result': result}, getattr(notification_dispatcher, result))
+    yield 'schedule_bot_dead_chats', 'gauge', 'Chats that can not receive messages', {}, len(dead_chats)
+    
+    yield ('schedule_bot_updates_in_flight', 'gauge', 'Telegram updates accepted and not handled yet', {},
+           application.update_queue.in_flight)
+    yield 'schedule_bot_users', 'gauge', 'Registered users', {}, len(user_data_store)
+
+
+async def post_init(application: Application) -> None:
+    """Start optional background services"""
+    global push_receiver, metrics_server
+    
+    if METRICS_PORT:
+        # Each worker process exposes its own metrics on the next port
+        metrics.add_collector(lambda: collect_runtime_metrics(application))
+        metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT + worker_index)
+        await metrics_server.start()
+    
+    if NOTIFICATION_PUSH_PORT and worker_index == 0:
+        if not WEBHOOK_API_KEY:
+            logger.error("NOTIFICATION_PUSH_PORT is set but WEBHOOK_API_KEY is empty, push receiver disabled")
+            return
+        push_receiver = NotificationPushReceiver(
+            notification_dispatcher,
+            NOTIFICATION_PUSH_HOST,
+            NOTIFICATION_PUSH_PORT,
+            WEBHOOK_API_KEY,
+            NOTIFICATION_PUSH_QUEUE_SIZE,
+        )
+        await push_receiver.start(application.bot)
+
+
 async def shutdown(application: Application) -> None:
     """Cleanup on shutdown"""
+    if push_receiver:
+        await push_receiver.stop()
+    if metrics_server:
+        await metrics_server.stop()
+    await status_batcher.close()
+    await user_data_store.close()
     await api.close()
     logger.info("Bot shutdown complete")
 
 
-def main() -> None:
-    """Start the bot"""
-    if not TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN not found in environment!")
-        return
+class FastJSONRequest(HTTPXRequest):
+    """Bot API request layer decoding responses with the configured JSON codec"""
     
-    # Create application
-    application = Application.builder().token(TOKEN).build()
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> dict:
+        try:
+            return json_loads(payload)
+        except ValueError as exc:
+            logger.error(f"Can not decode Bot API response: {payload[:200]!r}")
+            raise TelegramError("Invalid server response") from exc
+
+
+class UpdateQueue(asyncio.Queue):
+    """Update queue bounding updates in flight, i.e. queued or still being handled"""
+    
+    def __init__(self, limit: int):
+        # With concurrent updates the application takes every update off the queue right away
+        # and starts a task that waits for a handler slot, so a plain maxsize never fills. A slot
+        # is taken on put instead and given back on task_done, which the application calls once
+        # an update is handled (or dropped on shutdown).
+        super().__init__()
+        self.limit = limit
+        self.in_flight = 0
+        self._slot_freed = asyncio.Event()
+    
+    async def put(self, item) -> None:
+        while self.in_flight >= self.limit:
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+        self.put_nowait(item)
+    
+    def put_nowait(self, item) -> None:
+        if self.in_flight >= self.limit:
+            raise asyncio.QueueFull
+        self.in_flight += 1
+        super().put_nowait(item)
+    
+    def task_done(self) -> None:
+        super().task_done()
+        self.in_flight -= 1
+        self._slot_freed.set()
+
+
+def build_application(with_updater: bool = True) -> Application:
+    """Create the application with all update handlers (no background jobs)"""
+    # Create application. Limiting updates in flight gives backpressure: when handlers fall
+    # behind, polling stops fetching and webhook requests wait before being accepted.
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .update_queue(UpdateQueue(UPDATE_QUEUE_SIZE))
+    )
+    if not with_updater:
+        # Worker processes get their updates from the supervisor
+        builder = builder.updater(None)
+    if JSON_CODEC != 'json':
+        # Same pool sizes as the builder's defaults
+        builder = builder.request(FastJSONRequest(connection_pool_size=256))
+        builder = builder.get_updates_request(FastJSONRequest(connection_pool_size=1))
+    if TELEGRAM_API_BASE_URL:
+        base_url = TELEGRAM_API_BASE_URL.rstrip('/')
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
     
     # Register conversation handler for registration
     register_conv = ConversationHandler(
@@ -989,40 +3923,394 @@ def main() -> None:
             STUDENT_GROUP: [MessageHandler(filters.TEXT & ~filters.COMMAND, student_group)],
             STUDENT_SUBGROUP: [MessageHandler(filters.TEXT & ~filters.COMMAND, student_subgroup)],
             STUDENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, student_name)],
-            TEACHER_SELECT: [CallbackQueryHandler(teacher_selected)],
+            TEACHER_SELECT: [
+                CallbackQueryHandler(teacher_selected),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, teacher_search),
+            ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
     )
     
     # Add handlers
+    application.add_handler(TypeHandler(Update, revive_chat), group=-1)
     application.add_handler(register_conv)
     application.add_handler(CommandHandler('help', help_command))
     application.add_handler(CommandHandler('today', today_command))
     application.add_handler(CommandHandler('tomorrow', tomorrow_command))
     application.add_handler(CommandHandler('week', week_command))
     application.add_handler(CommandHandler('profile', profile_command))
+    application.add_handler(CommandHandler('stats', stats_command))
+    application.add_handler(CommandHandler('reminders', reminders_command))
     application.add_handler(CallbackQueryHandler(button_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_keyboard_buttons))
     
     # Add error handler
     application.add_error_handler(error_handler)
+    return application
+
+
+def schedule_jobs(application: Application, primary: bool = True) -> None:
+    """Register background jobs; only the primary process sends notifications and reminders"""
+    job_queue = application.job_queue
+    
+    # Persist user records in the background (write-behind)
+    job_queue.run_repeating(flush_user_store, interval=USER_STORE_FLUSH_INTERVAL)
+    
+    if BOT_WORKERS > 1:
+        job_queue.run_repeating(sync_shared_state, interval=BOT_WORKER_SYNC_INTERVAL)
+    
+    if not primary:
+        return
     
     # Set up notification processing job
-    job_queue = application.job_queue
-    job_queue.run_repeating(
+    job_queue.run_once(
         process_notifications,
-        interval=NOTIFICATION_CHECK_INTERVAL,
-        first=10  # Start after 10 seconds
+        when=10,  # Start after 10 seconds
+        name='process_notifications'
     )
-    logger.info(f"Notification processor started (checking every {NOTIFICATION_CHECK_INTERVAL} seconds)")
+    logger.info(
+        f"Notification processor started (polling every {NOTIFICATION_MIN_INTERVAL}-"
+        f"{NOTIFICATION_CHECK_INTERVAL} seconds depending on load)"
+    )
+    
+    # Reminders before classes: one heap for all users, checked every REMINDER_TICK seconds
+    if REMINDER_MINUTES > 0:
+        api.snapshots.listeners.append(sync_reminders)
+        job_queue.run_repeating(refresh_reminders, interval=REMINDER_REFRESH_INTERVAL, first=15)
+        job_queue.run_repeating(send_reminders, interval=REMINDER_TICK, first=REMINDER_TICK)
+        logger.info(f"Class reminders enabled ({REMINDER_MINUTES} minutes before start)")
+    
+    # Warm schedules before peak hours
+    for at, periods in parse_prefetch_schedule(PREFETCH_SCHEDULE).items():
+        try:
+            run_at = datetime.strptime(at, '%H:%M').time().replace(tzinfo=LOCAL_TZ)
+        except ValueError:
+            logger.error(f"Ignoring invalid PREFETCH_SCHEDULE time: {at}")
+            continue
+        job_queue.run_daily(prefetch_schedules, time=run_at, data=periods, name=f'prefetch_schedules_{at}')
+        logger.info(f"Schedule prefetch for {', '.join(periods)} at {at}")
+
+
+# Index of this worker process in supervisor mode (0 also in single-process mode)
+worker_index = 0
+
+
+def update_routing_key(data: dict) -> int:
+    """User id of a raw update (chat id or update id if it has no user), used for worker affinity"""
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        for field in ('from', 'user', 'chat'):
+            owner = value.get(field)
+            if isinstance(owner, dict) and isinstance(owner.get('id'), int):
+                return owner['id']
+    return data.get('update_id', 0)
+
+
+class WorkerUpdateReceiver:
+    """Local endpoint of a worker process accepting updates routed by the supervisor"""
+    
+    def __init__(self, application: Application, port: int, secret: str):
+        self.application = application
+        self.port = port
+        self.secret = secret
+        self.received = 0
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post('/updates', self._handle_updates)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+        logger.info(f"Worker {worker_index} accepting updates on 127.0.0.1:{self.port}")
+    
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+    
+    async def _handle_updates(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get('X-Worker-Secret', ''), self.secret):
+            return web.Response(status=401)
+        
+        try:
+            batch = await request.json(loads=json_loads)
+        except ValueError:
+            return web.Response(status=400)
+        
+        # put waits while UPDATE_QUEUE_SIZE updates are in flight, so the response is held back and
+        # the supervisor's sender for this worker stops until handlers catch up
+        for data in batch:
+            await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        self.received += len(batch)
+        return web.Response(status=204)
+
+
+async def serve_worker(index: int, secret: str) -> None:
+    """Run one worker: handlers and jobs of a normal bot, fed by the supervisor"""
+    global worker_index
+    worker_index = index
+    
+    application = build_application(with_updater=False)
+    schedule_jobs(application, primary=index == 0)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    receiver = WorkerUpdateReceiver(application, BOT_WORKER_BASE_PORT + index, secret)
+    try:
+        async with application:
+            await post_init(application)
+            await application.start()
+            await receiver.start()
+            logger.info(f"Worker {index} started{' (notifications and reminders)' if index == 0 else ''}")
+            await stop.wait()
+            await receiver.stop()
+            await application.stop()
+    finally:
+        await shutdown(application)
+
+
+def run_worker(index: int, secret: str) -> None:
+    """Entry point of a worker process"""
+    asyncio.run(serve_worker(index, secret))
+
+
+class UpdateRouter:
+    """Supervisor front-end: forwards raw updates to worker processes by user affinity"""
+    
+    BATCH_SIZE = 100
+    
+    def __init__(self, workers: int, base_port: int, secret: str, queue_size: int):
+        self.urls = [f"http://127.0.0.1:{base_port + i}/updates" for i in range(workers)]
+        self.secret = secret
+        self.routed = [0] * workers
+        self._queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._senders: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def start(self) -> None:
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, connect=5), json_serialize=json_dumps
+        )
+        self._senders = [asyncio.create_task(self._send(i)) for i in range(len(self.urls))]
+    
+    async def stop(self) -> None:
+        for task in self._senders:
+            task.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+    
+    async def route(self, data: dict) -> None:
+        """Queue an update for its worker; waits while that worker is behind"""
+        await self._queues[update_routing_key(data) % len(self.urls)].put(data)
+    
+    async def _send(self, index: int) -> None:
+        # One sender per worker keeps each user's updates in order
+        queue = self._queues[index]
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < self.BATCH_SIZE:
+                batch.append(queue.get_nowait())
+            
+            # Retry until the worker takes the batch: it may be starting or being restarted
+            while True:
+                try:
+                    async with self._session.post(
+                        self.urls[index], json=batch, headers={'X-Worker-Secret': self.secret}
+                    ) as response:
+                        if response.status == 204:
+                            break
+                        logger.warning(f"Worker {index} rejected updates with HTTP {response.status}")
+                except aiohttp.ClientError as e:
+                    logger.warning(f"Worker {index} is unavailable: {e}")
+                await asyncio.sleep(1)
+            self.routed[index] += len(batch)
+
+
+class WorkerPool:
+    """Worker processes of the supervisor; workers that exit are started again"""
+    
+    RESTART_DELAY = 5
+    
+    def __init__(self, workers: int, secret: str):
+        self.secret = secret
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+    
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(target=run_worker, args=(index, self.secret), name=f'worker-{index}')
+        process.start()
+        self._processes[index] = process
+    
+    def start(self) -> None:
+        for index in range(len(self._processes)):
+            self._spawn(index)
+        logger.info(f"Started {len(self._processes)} worker processes")
+    
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.RESTART_DELAY)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._spawn(index)
+    
+    def stop(self, timeout: float = 30) -> None:
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+
+
+async def telegram_api_call(session: aiohttp.ClientSession, method: str, payload: dict):
+    """Raw Bot API call; the supervisor only forwards JSON and never builds Update objects"""
+    base_url = (TELEGRAM_API_BASE_URL or 'https://api.telegram.org').rstrip('/')
+    async with session.post(f"{base_url}/bot{TOKEN}/{method}", json=payload) as response:
+        data = json_loads(await response.read())
+    if not data.get('ok'):
+        raise RuntimeError(f"{method} failed: {data.get('description')}")
+    return data['result']
+
+
+async def poll_updates(session: aiohttp.ClientSession, router: UpdateRouter) -> None:
+    """Supervisor intake in polling mode"""
+    await telegram_api_call(session, 'deleteWebhook', {})
+    offset = 0
+    while True:
+        try:
+            updates = await telegram_api_call(session, 'getUpdates', {
+                'offset': offset, 'timeout': 30, 'allowed_updates': ALLOWED_UPDATES,
+            })
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+            logger.warning(f"Polling error: {e}")
+            await asyncio.sleep(5)
+            continue
+        for data in updates:
+            offset = data['update_id'] + 1
+            await router.route(data)
+
+
+async def serve_webhook(session: aiohttp.ClientSession, router: UpdateRouter) -> web.AppRunner:
+    """Supervisor intake in webhook mode"""
+    async def handle_update(request: web.Request) -> web.Response:
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if TELEGRAM_WEBHOOK_SECRET and not hmac.compare_digest(secret, TELEGRAM_WEBHOOK_SECRET):
+            return web.Response(status=403)
+        try:
+            data = await request.json(loads=json_loads)
+        except ValueError:
+            return web.Response(status=400)
+        await router.route(data)
+        return web.Response()
+    
+    app = web.Application()
+    app.router.add_post(f"/{TELEGRAM_WEBHOOK_PATH.strip('/')}", handle_update)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, TELEGRAM_WEBHOOK_LISTEN, TELEGRAM_WEBHOOK_PORT).start()
+    
+    payload = {
+        'url': f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{TELEGRAM_WEBHOOK_PATH}",
+        'allowed_updates': ALLOWED_UPDATES,
+        'max_connections': TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+    }
+    if TELEGRAM_WEBHOOK_SECRET:
+        payload['secret_token'] = TELEGRAM_WEBHOOK_SECRET
+    await telegram_api_call(session, 'setWebhook', payload)
+    logger.info(f"Webhook listening on {TELEGRAM_WEBHOOK_LISTEN}:{TELEGRAM_WEBHOOK_PORT}")
+    return runner
+
+
+async def run_supervisor() -> None:
+    """Receive updates and route each user's updates to the same worker process"""
+    secret = secrets.token_hex(16)
+    pool = WorkerPool(BOT_WORKERS, secret)
+    router = UpdateRouter(BOT_WORKERS, BOT_WORKER_BASE_PORT, secret, UPDATE_QUEUE_SIZE)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    pool.start()
+    await router.start()
+    session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60), json_serialize=json_dumps)
+    webhook_runner = None
+    tasks = [asyncio.create_task(pool.watch())]
+    try:
+        if BOT_MODE == 'webhook':
+            webhook_runner = await serve_webhook(session, router)
+        else:
+            tasks.append(asyncio.create_task(poll_updates(session, router)))
+        logger.info(f"Supervisor started in {BOT_MODE} mode with {BOT_WORKERS} workers")
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if webhook_runner:
+            await webhook_runner.cleanup()
+        # Give workers a moment to take what is already queued
+        await asyncio.sleep(1)
+        await router.stop()
+        await session.close()
+        await asyncio.to_thread(pool.stop)
+        logger.info(f"Supervisor stopped, updates routed per worker: {router.routed}")
+
+
+def main() -> None:
+    """Start the bot"""
+    if not TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not found in environment!")
+        return
+    
+    if BOT_MODE not in ('polling', 'webhook'):
+        logger.error(f"Unknown BOT_MODE: {BOT_MODE}")
+        return
     
-    # Run cleanup on shutdown
+    if BOT_MODE == 'webhook' and not TELEGRAM_WEBHOOK_URL:
+        logger.error("TELEGRAM_WEBHOOK_URL is required in webhook mode!")
+        return
+    
+    if BOT_WORKERS > 1:
+        # Workers share users and dead chats through the SQLite file
+        if USER_STORE_BACKEND != 'sqlite':
+            logger.error("BOT_WORKERS > 1 requires USER_STORE_BACKEND=sqlite")
+            return
+        asyncio.run(run_supervisor())
+        return
+    
+    application = build_application()
+    schedule_jobs(application)
+    
+    # Start optional services and run cleanup on shutdown
+    application.post_init = post_init
     application.post_shutdown = shutdown
     
-    logger.info("Bot started successfully!")
+    logger.info(f"Bot started successfully in {BOT_MODE} mode!")
     
-    # Start polling
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        application.run_webhook(
+            listen=TELEGRAM_WEBHOOK_LISTEN,
+            port=TELEGRAM_WEBHOOK_PORT,
+            url_path=TELEGRAM_WEBHOOK_PATH,
+            webhook_url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{TELEGRAM_WEBHOOK_PATH}",
+            secret_token=TELEGRAM_WEBHOOK_SECRET or None,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':